@@ -0,0 +1,299 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gallery_server import GalleryServer, ServerConfig, make_catalogue, slugify
+
+# Đo các đường nóng với server giả lập chạy cục bộ, in kết quả JSON (thông lượng + độ trễ p50/p95)
+# để so giữa các lần chạy:
+#   python benchmarks/bench.py -o before.json
+#   python benchmarks/bench.py --latency 0.05 --error-rate 0.02 --baseline before.json
+# discover       : dò số trang như load_pages (discover_pages), mỗi mẫu một diễn viên chưa có số trang
+# discover_recheck: dò lại khi số trang đã lưu hết hạn (dùng số cũ làm gợi ý)
+# download       : tải hết như download_all_images (download_pages, PRIORITY_BULK), mỗi mẫu một diễn viên
+# decode_cold/warm: giải mã một trang như load_page_images (PageLoad không tải mạng), chưa có / đã có cache thumbnail
+# texture/texture_full: pil_to_texture với ảnh cỡ PAGE_THUMB_SIZE / ảnh gốc
+# Thư mục làm việc là thư mục tạm (DB, ảnh tải về), xoá khi xong trừ khi có --keep.
+
+BENCHMARKS = ("discover", "download", "decode", "texture")
+APP_BENCHMARKS = ("decode", "texture")  # Cần import main (Kivy, cửa sổ OpenGL)
+TEXTURE_SAMPLES = 48
+
+def percentile(values, q):
+    # Nội suy tuyến tính giữa hai hạng gần nhất
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize(latencies, count, elapsed, unit, **extra):
+    ms = [latency * 1000 for latency in latencies]
+    result = {
+        "samples": len(ms),
+        "count": count,
+        "unit": unit,
+        "elapsed_s": round(elapsed, 4),
+        "throughput": round(count / elapsed, 2) if elapsed > 0 else None,  # unit mỗi giây
+        "latency_ms": {
+            "p50": round(percentile(ms, 0.5), 2) if ms else None,
+            "p95": round(percentile(ms, 0.95), 2) if ms else None,
+            "mean": round(sum(ms) / len(ms), 2) if ms else None,
+            "max": round(max(ms), 2) if ms else None,
+        },
+    }
+    result.update(extra)
+    return result
+
+def progress(text):
+    print(text, file=sys.stderr, flush=True)
+
+def actor_galleries(downloader, catalogue):
+    # (tên, slug, thư mục, số trang) theo cách app xử lý ô nhập tên
+    galleries = []
+    for name, (pages, _) in catalogue.items():
+        slug, folder_name, sub_name = downloader.process_actor_input(name)
+        galleries.append((sub_name, slug, folder_name, pages))
+    return galleries
+
+def bench_discover(downloader, galleries, server):
+    latencies = []
+    wrong = []
+    requests_before = server.snapshot().get("requests", 0)
+    started = time.perf_counter()
+    for sub_name, slug, folder_name, pages in galleries:
+        t = time.perf_counter()
+        page_count = downloader.discover_pages(slug, folder_name, sub_name)
+        latencies.append(time.perf_counter() - t)
+        if page_count != pages:
+            wrong.append(f"{sub_name}: {page_count}")
+    elapsed = time.perf_counter() - started
+    requests = server.snapshot().get("requests", 0) - requests_before
+    return summarize(latencies, len(galleries), elapsed, "actor",
+                     requests_per_actor=round(requests / len(galleries), 2), wrong=wrong)
+
+def expire_page_counts(downloader):
+    downloader.db.execute("UPDATE actors SET page_count_checked = 0")
+
+def bench_download(downloader, galleries):
+    latencies = []
+    images = failed = size = 0
+    started = time.perf_counter()
+    for sub_name, slug, folder_name, pages in galleries:
+        t = time.perf_counter()
+        downloader.download_pages(range(1, pages + 1), slug, folder_name, sub_name, downloader.PRIORITY_BULK)
+        latencies.append(time.perf_counter() - t)
+        for entry in downloader.get_manifest(sub_name, 1, pages).values():
+            if entry.status == downloader.STATUS_DONE:
+                images += 1
+                size += entry.size or 0
+            elif entry.status in (downloader.STATUS_FAILED, downloader.STATUS_PARTIAL):
+                failed += 1
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, images, elapsed, "image", failed=failed, mib=round(size / 2 ** 20, 2),
+                     mib_per_s=round(size / 2 ** 20 / elapsed, 2) if elapsed > 0 else None)
+
+def bench_decode(app, galleries):
+    latencies = []
+    images = [0]
+    missing = [0]
+
+    def on_image(img_num, path, buffer, data):
+        images[0] += 1
+
+    def on_missing(img_num):
+        missing[0] += 1
+
+    started = time.perf_counter()
+    for sub_name, slug, folder_name, pages in galleries:
+        for page in range(1, pages + 1):
+            t = time.perf_counter()
+            app.PageLoad(sub_name, page, folder_name, slug, download=False).run(on_image, on_missing)
+            latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, images[0], elapsed, "image", pages=len(latencies), missing=missing[0])
+
+def bench_texture(app, paths, size=None):
+    from PIL import Image as PILImage
+    images = []
+    for path in paths:
+        image = PILImage.open(path)
+        if size:
+            image.thumbnail((size, size))
+        images.append(image.convert("RGB"))
+    latencies = []
+    pixels = 0
+    started = time.perf_counter()
+    for image in images:
+        t = time.perf_counter()
+        app.pil_to_texture(image)
+        latencies.append(time.perf_counter() - t)
+        pixels += image.width * image.height
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, len(images), elapsed, "image",
+                     mpix_per_s=round(pixels / 1e6 / elapsed, 2) if elapsed > 0 else None)
+
+def compare(results, baseline):
+    # Thay đổi so với lần chạy trước, theo phần trăm: throughput tăng là tốt, độ trễ tăng là xấu
+    def change(new, old):
+        if new is None or not old:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    changes = {}
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old or "skipped" in result or "skipped" in old:
+            continue
+        changes[name] = {
+            "throughput_pct": change(result["throughput"], old.get("throughput")),
+            "p50_pct": change(result["latency_ms"]["p50"], old.get("latency_ms", {}).get("p50")),
+            "p95_pct": change(result["latency_ms"]["p95"], old.get("latency_ms", {}).get("p95")),
+        }
+    return changes
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark các đường tải/giải mã với server giả lập cục bộ.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"các benchmark cần chạy, cách nhau dấu phẩy (mặc định {','.join(BENCHMARKS)})")
+    parser.add_argument("--actors", type=int, default=5, help="số diễn viên giả lập (mặc định 5)")
+    parser.add_argument("--pages", type=int, default=6, help="số trang mỗi diễn viên (mặc định 6)")
+    parser.add_argument("--latency", type=float, default=0.0, help="giây server chờ trước mỗi phản hồi")
+    parser.add_argument("--bandwidth", type=int, default=0, help="KiB/s mỗi kết nối (0 = không giới hạn)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ request trả 503")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="tỉ lệ ảnh bị đứt giữa chừng")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="tỉ lệ ảnh bị treo giữa chừng (mỗi ảnh mất một timeout)")
+    parser.add_argument("--missing-rate", type=float, default=0.05, help="tỉ lệ ảnh chuyển hướng 404 (mặc định 0.05)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--app-limits", action="store_true",
+                        help="giữ giới hạn request/băng thông của app (mặc định bỏ để đo chính đường tải)")
+    parser.add_argument("--baseline", help="file JSON của lần chạy trước để so sánh")
+    parser.add_argument("-o", "--output", help="ghi kết quả JSON ra file (ngoài stdout)")
+    parser.add_argument("--keep", action="store_true", help="giữ thư mục làm việc tạm")
+    parser.add_argument("-v", "--verbose", action="store_true", help="in log của app")
+    args = parser.parse_args(argv)
+    args.only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmark không tồn tại: {', '.join(sorted(unknown))}")
+    if args.actors < 1 or args.pages < 1:
+        parser.error("--actors và --pages phải lớn hơn 0")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="jjdl-bench-")
+    os.chdir(workdir)  # PARENT_FOLDER (DB, ảnh, cache thumbnail) là đường dẫn tương đối
+
+    catalogue = make_catalogue(args.actors, args.pages, args.seed)
+    config = ServerConfig(args.latency, args.bandwidth * 1024, args.error_rate, args.truncate_rate,
+                          args.stall_rate, args.missing_rate, args.seed)
+    server = GalleryServer(catalogue, config)  # Mở cổng ngay, luồng phục vụ chạy sau khi fork DecodePool
+    os.environ["JJDL_BASE_URL"] = f"{server.url}/japanese"
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    if not args.verbose:
+        os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+    import downloader
+    from httpbase import get_transport_stats
+    app = None
+    skipped = {}
+    if any(name in APP_BENCHMARKS for name in args.only):
+        try:
+            import main as app
+            app.decode_pool.start()
+        except Exception as e:  # Không có Kivy / không tạo được cửa sổ OpenGL
+            app = None
+            skipped = {name: {"skipped": f"{type(e).__name__}: {e}"} for name in APP_BENCHMARKS}
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    server.start()
+    downloader.init_db()
+    if not args.app_limits:
+        downloader.request_limiter.set_rate(0, 1)
+        downloader.bandwidth.set_profile(downloader.NORMAL_PROFILE._replace(
+            name="bench", background_rate=0, contended_rate=0))
+
+    galleries = actor_galleries(downloader, catalogue)
+    results = {}
+    try:
+        if "discover" in args.only:
+            progress("discover...")
+            results["discover"] = bench_discover(downloader, galleries, server)
+            expire_page_counts(downloader)
+            results["discover_recheck"] = bench_discover(downloader, galleries, server)
+        if "download" in args.only or app is not None:
+            progress("download...")
+            download = bench_download(downloader, galleries)
+            if "download" in args.only:
+                results["download"] = download  # Không chọn thì chỉ là bước chuẩn bị ảnh cho decode/texture
+        if "decode" in args.only:
+            results.update({"decode_cold": skipped.get("decode"), "decode_warm": skipped.get("decode")})
+            if app is not None:
+                progress("decode...")
+                shutil.rmtree(downloader.THUMBNAIL_CACHE_FOLDER, ignore_errors=True)
+                results["decode_cold"] = bench_decode(app, galleries)
+                results["decode_warm"] = bench_decode(app, galleries)
+        if "texture" in args.only:
+            results.update({"texture": skipped.get("texture"), "texture_full": skipped.get("texture")})
+            if app is not None:
+                progress("texture...")
+                paths = sorted(glob.glob(os.path.join(downloader.PARENT_FOLDER, "*", "*.jpg")))[:TEXTURE_SAMPLES]
+                results["texture"] = bench_texture(app, paths, app.PAGE_THUMB_SIZE)
+                results["texture_full"] = bench_texture(app, paths)
+    finally:
+        if app is not None:
+            app.decode_pool.shutdown()
+        downloader.db.close()
+        server.stop()
+        os.chdir(ROOT)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    transport = get_transport_stats()
+    transport.pop("per_connection")
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "actors": args.actors,
+            "pages": args.pages,
+            "app_limits": args.app_limits,
+            "server": config._asdict(),
+            "catalogue": {slugify(name): list(shape) for name, shape in catalogue.items()},
+        },
+        "results": results,
+        "server": server.snapshot(),
+        "transport": transport,
+    }
+    if baseline is not None:
+        report["baseline"] = compare(results, baseline)
+    if args.keep:
+        report["workdir"] = workdir
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gallery_server import GalleryServer, ServerConfig, DEFAULT_CONFIG, make_catalogue, slugify
+
+# Kiểm tra nhanh: ảnh bị treo giữa thân (server gửi header + nửa ảnh rồi ngừng) phải được báo là hết thời gian
+# chờ (timed_out=True), để ConcurrencyController hạ số lượt tải ngay thay vì coi như lỗi kết nối thường.
+#   python benchmarks/check_stall.py
+# Thoát mã 1 nếu sai.
+
+TIMEOUT = 0.5  # Timeout đọc của lượt tải thử, ngắn hơn nhiều so với STALL_SECONDS của server
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="jjdl-check-")
+    os.chdir(workdir)  # PARENT_FOLDER của downloader là đường dẫn tương đối
+    catalogue = make_catalogue(1, 1, DEFAULT_CONFIG.seed)
+    server = GalleryServer(catalogue, ServerConfig(**dict(DEFAULT_CONFIG._asdict(), stall_rate=1.0))).start()
+    os.environ["JJDL_BASE_URL"] = f"{server.url}/japanese"
+    logging.getLogger().setLevel(logging.CRITICAL)
+    import downloader
+    downloader.retry_policy = downloader.RetryPolicy(attempts=1)
+    slug = slugify(next(iter(catalogue)))
+    try:
+        outcome = downloader.fetch_to_file(downloader.image_url(slug, 1, 1), os.path.join(workdir, "1.jpg"),
+                                           threshold=1, timeout=TIMEOUT)
+    finally:
+        server.stop()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"status={outcome.status} timed_out={outcome.timed_out} error={outcome.error}")
+    if outcome.status != downloader.STATUS_FAILED or not outcome.timed_out:
+        print("FAIL: stalled body was not reported as a timeout")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import io
+import re
+import time
+import random
+import socket
+import hashlib
+import threading
+from collections import Counter, namedtuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image, ImageFilter
+
+# Server giả lập trang ảnh, cùng bố cục URL /japanese/{slug}/{trang}/{slug}-{số}.jpg, chạy trên 127.0.0.1.
+# Ảnh JPEG tổng hợp cỡ ảnh thật (~250KB, 900x1350); ảnh/trang không tồn tại được chuyển hướng tới
+# /404.Not.Found.svg như server thật. Độ trễ, băng thông mỗi kết nối, tỉ lệ lỗi 503, tỉ lệ đứt
+# kết nối giữa chừng và tỉ lệ treo giữa chừng chỉnh được để đo đường tải trong các điều kiện mạng khác nhau.
+#   python benchmarks/gallery_server.py --port 8000 --latency 0.05
+#   JJDL_BASE_URL=http://127.0.0.1:8000/japanese python cli.py "Bench Actor1"
+
+IMAGES_PER_PAGE = 12  # Như trang thật; trang cuối của mỗi diễn viên có ít ảnh hơn
+IMAGE_SIZE = (900, 1350)
+IMAGE_QUALITY = 88
+IMAGE_VARIANTS = 6  # Số ảnh khác nhau được tạo sẵn, phục vụ xoay vòng theo URL
+WRITE_CHUNK = 16 * 1024
+STALL_SECONDS = 30  # Ảnh bị treo ngừng gửi lâu hơn timeout đọc của app (10s) rồi mới đóng kết nối
+
+ServerConfig = namedtuple("ServerConfig", "latency bandwidth error_rate truncate_rate stall_rate missing_rate seed")
+DEFAULT_CONFIG = ServerConfig(latency=0.0, bandwidth=0, error_rate=0.0, truncate_rate=0.0, stall_rate=0.0,
+                              missing_rate=0.0, seed=1)
+
+IMAGE_PATH = re.compile(r"^/japanese/([^/]+)/(\d+)/([^/]+)-(\d+)\.jpg$")
+NOT_FOUND_PATH = "/404.Not.Found.svg"
+NOT_FOUND_BODY = b'<svg xmlns="http://www.w3.org/2000/svg"/>'
+
+def make_jpeg(size=IMAGE_SIZE, quality=IMAGE_QUALITY):
+    # Nhiễu làm mờ + gradient: nén JPEG ra cỡ gần ảnh chụp thật, không phải ảnh phẳng vài KB
+    width, height = size
+    noise = Image.effect_noise((width // 2, height // 2), 40).resize(size)
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5)))
+    buffer = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(1)).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+def slugify(name):
+    return name.lower().replace(" ", "-")
+
+def make_catalogue(actors, pages, seed):
+    # Tên diễn viên -> (số trang, số ảnh trang cuối); cố định theo seed để các lần chạy so sánh được
+    rng = random.Random(seed)
+    return {f"Bench Actor{i + 1}": (pages, rng.randint(1, IMAGES_PER_PAGE)) for i in range(actors)}
+
+class GalleryServer:
+    def __init__(self, catalogue, config=DEFAULT_CONFIG, port=0):
+        self.catalogue = {slugify(name): shape for name, shape in catalogue.items()}
+        self.config = config
+        self.images = [make_jpeg() for _ in range(IMAGE_VARIANTS)]
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _chance(self, path, kind, rate):
+        # Quyết định theo URL (không theo lần gọi) cho ảnh thiếu, để thử lại không làm ảnh "xuất hiện"
+        digest = hashlib.blake2b(f"{self.config.seed}:{kind}:{path}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2 ** 64 < rate
+
+    def image_for(self, path):
+        # Ảnh có trong catalogue -> (dữ liệu, etag); None nếu server thật sẽ chuyển hướng 404
+        match = IMAGE_PATH.match(path)
+        if not match or match.group(1) != match.group(3) or match.group(1) not in self.catalogue:
+            return None
+        pages, last_page_images = self.catalogue[match.group(1)]
+        page, img_num = int(match.group(2)), int(match.group(4))
+        if not 1 <= page <= pages or not 1 <= img_num <= (last_page_images if page == pages else IMAGES_PER_PAGE):
+            return None
+        if img_num > 1 and self._chance(path, "missing", self.config.missing_rate):  # Ảnh 1 giữ để dò trang
+            return None
+        variant = (page * IMAGES_PER_PAGE + img_num) % len(self.images)
+        return self.images[variant], f'"v{variant}"'
+
+    def _handler(self):
+        gallery = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive như CDN thật, để đo được việc dùng lại kết nối
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                gallery.count("connections")
+
+            def do_GET(self):
+                self.serve(body=True)
+
+            def do_HEAD(self):
+                self.serve(body=False)
+
+            def serve(self, body):
+                config = gallery.config
+                gallery.count("requests")
+                if config.latency:
+                    time.sleep(config.latency)
+                if self.path.startswith(NOT_FOUND_PATH):
+                    return self.reply(200, NOT_FOUND_BODY, body, {"Content-Type": "image/svg+xml"})
+                found = gallery.image_for(self.path)
+                if found is None:
+                    gallery.count("redirects")
+                    return self.reply(302, b"", body, {"Location": NOT_FOUND_PATH})
+                if config.error_rate and random.random() < config.error_rate:
+                    gallery.count("errors")
+                    return self.reply(503, b"", body)
+                data, etag = found
+                headers = {"Content-Type": "image/jpeg", "ETag": etag}
+                byte_range = self.parse_range(self.headers.get("Range"), len(data))
+                if byte_range and self.headers.get("If-Range") not in (None, etag):
+                    byte_range = None  # Validator lệch -> gửi lại cả file như server thật
+                status = 200
+                if byte_range:
+                    start, end = byte_range
+                    status = 206
+                    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                    data = data[start:end + 1]
+                self.reply(status, data, body, headers)
+
+            @staticmethod
+            def parse_range(value, size):
+                match = re.match(r"bytes=(\d*)-(\d*)$", value or "")
+                if not match or not match.group(1):
+                    return None
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                return (start, end) if start <= end else None
+
+            def reply(self, status, data, body, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if not body or not data:
+                    return
+                config = gallery.config
+                truncate = status in (200, 206) and config.truncate_rate and random.random() < config.truncate_rate
+                stall = status in (200, 206) and config.stall_rate and random.random() < config.stall_rate
+                end = len(data) // 2 if truncate or stall else len(data)
+                for start in range(0, end, WRITE_CHUNK):
+                    chunk = data[start:min(end, start + WRITE_CHUNK)]
+                    self.wfile.write(chunk)
+                    if config.bandwidth:  # Băng thông mỗi kết nối, byte/giây
+                        self.wfile.flush()
+                        time.sleep(len(chunk) / config.bandwidth)
+                gallery.count("bytes", end)
+                if stall:  # Giữ kết nối mà không gửi tiếp, như CDN bị nghẽn
+                    gallery.count("stalled")
+                    self.wfile.flush()
+                    time.sleep(STALL_SECONDS)
+                if truncate:
+                    gallery.count("truncated")
+                if truncate or stall:
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+
+        return Handler
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Server giả lập trang ảnh cho benchmark.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--actors", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.0, help="giây chờ trước mỗi phản hồi")
+    parser.add_argument("--bandwidth", type=int, default=0, help="KiB/s mỗi kết nối (0 = không giới hạn)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ request trả 503")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="tỉ lệ ảnh bị đứt giữa chừng")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="tỉ lệ ảnh bị treo giữa chừng")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="tỉ lệ ảnh chuyển hướng 404")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    catalogue = make_catalogue(args.actors, args.pages, args.seed)
+    config = ServerConfig(args.latency, args.bandwidth * 1024, args.error_rate, args.truncate_rate,
+                          args.stall_rate, args.missing_rate, args.seed)
+    server = GalleryServer(catalogue, config, args.port).start()
+    print(f"Serving {server.url}/japanese: {', '.join(catalogue)}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
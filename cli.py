@@ -0,0 +1,159 @@
+import os
+import sys
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from downloader import (
+    NORMAL_PROFILE, PRIORITY_BULK, REQUEST_RATE, STATUS_FAILED, STATUS_PARTIAL,
+    db, init_db, update_actor_config, get_manifest, log_transport_stats, JobControl, validate_actor_input,
+    process_actor_input, image_path, cover_path, bandwidth, request_limiter, discover_pages, download_pages,
+)
+
+# Tải hàng loạt không cần giao diện (server, cron), dùng chung DB và thư mục ảnh với app:
+#   python cli.py "Kaori Yamashita" "Yua Mikami"
+#   python cli.py -f actors.txt -j 4 --pages 1-5
+#   cat actors.txt | python cli.py
+# Mã thoát: 0 = tải xong hết, 1 = có diễn viên/ảnh lỗi, 2 = tham số sai, 130 = bị ngắt (Ctrl+C).
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+PARALLEL_ACTORS = 3  # Số diễn viên tải cùng lúc; số luồng tải do ConcurrencyController tự chỉnh
+PROGRESS_STEP = 10  # In tiến độ mỗi khi tăng thêm từng này phần trăm
+
+class ProgressPrinter:
+    # Mỗi dòng một sự kiện, có tên diễn viên ở đầu để đọc được khi nhiều diễn viên tải song song
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def line(self, actor, text):
+        with self.lock:
+            print(f"[{actor}] {text}", file=self.stream, flush=True)
+
+    def tracker(self, actor):
+        last_step = [-1]
+
+        def progress(done, total):
+            step = int(done * 100 / total) // PROGRESS_STEP
+            if step > last_step[0]:
+                last_step[0] = step
+                self.line(actor, f"{done}/{total} ảnh ({done * 100 / total:.0f}%)")
+        return progress
+
+def parse_page_range(value):
+    first, _, last = value.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"phạm vi trang không hợp lệ: {value}")
+    if first < 1 or last < first:
+        raise argparse.ArgumentTypeError(f"phạm vi trang không hợp lệ: {value}")
+    return first, last
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Tải ảnh của nhiều diễn viên, không cần giao diện.")
+    parser.add_argument("actors", nargs="*", help="tên diễn viên; bỏ trống thì đọc từ --file hoặc stdin")
+    parser.add_argument("-f", "--file", help="file danh sách diễn viên, mỗi dòng một tên ('-' = stdin)")
+    parser.add_argument("-j", "--parallel", type=int, default=PARALLEL_ACTORS,
+                        help=f"số diễn viên tải cùng lúc (mặc định {PARALLEL_ACTORS})")
+    parser.add_argument("--pages", type=parse_page_range, help="chỉ tải các trang FIRST-LAST, ví dụ 1-5")
+    parser.add_argument("--rate", type=int, default=0,
+                        help="giới hạn băng thông tổng, KiB/s (mặc định 0 = không giới hạn)")
+    parser.add_argument("--request-rate", type=float, default=REQUEST_RATE,
+                        help=f"số request tối đa mỗi giây (mặc định {REQUEST_RATE}, 0 = không giới hạn)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="in log chi tiết")
+    args = parser.parse_args(argv)
+    if args.parallel < 1:
+        parser.error("--parallel phải lớn hơn 0")
+    if args.rate < 0 or args.request_rate < 0:
+        parser.error("--rate và --request-rate không được âm")
+    args.actors = read_actors(args)
+    if not args.actors:
+        parser.error("không có diễn viên nào (truyền tên, dùng --file hoặc đưa qua stdin)")
+    return args
+
+def read_actors(args):
+    lines = list(args.actors)
+    if args.file == "-" or (args.file is None and not lines and not sys.stdin.isatty()):
+        lines.extend(sys.stdin)
+    elif args.file:
+        with open(args.file, encoding="utf-8") as f:
+            lines.extend(f)
+    actors = []
+    for line in lines:
+        name = line.strip()
+        if name and not name.startswith("#") and name not in actors:
+            actors.append(name)
+    return actors
+
+def download_actor(actor_input, page_range, printer, job):
+    from requests import RequestException
+    valid, message = validate_actor_input(actor_input)
+    if not valid:
+        printer.line(actor_input, message)
+        return False
+    slug, folder_name, sub_name = process_actor_input(actor_input)
+    try:
+        page_count = discover_pages(slug, folder_name, sub_name)
+    except RequestException as e:
+        printer.line(sub_name, f"lỗi mạng khi dò số trang: {e}")
+        return False
+    if page_count < 1:
+        printer.line(sub_name, "không tìm thấy trang nào")
+        return False
+    first, last = page_range or (1, page_count)
+    last = min(last, page_count)
+    if first > last:
+        printer.line(sub_name, f"chỉ có {page_count} trang")
+        return False
+    update_actor_config(sub_name, folder_name, cover_path(sub_name))  # Hiện trong lịch sử của app
+    printer.line(sub_name, f"{page_count} trang, tải trang {first}-{last}")
+    errors = download_pages(range(first, last + 1), slug, folder_name, sub_name, PRIORITY_BULK,
+                            progress=printer.tracker(sub_name), job=job)
+    if errors is None:
+        printer.line(sub_name, "đã huỷ")
+        return False
+    # errors gồm cả ảnh không tồn tại (trang ít ảnh hơn IMAGES_PER_PAGE): chỉ ảnh tải hỏng mới tính là lỗi
+    manifest = get_manifest(sub_name, first, last)
+    failed = sorted(key for key, entry in manifest.items() if entry.status in (STATUS_FAILED, STATUS_PARTIAL))
+    if failed:
+        shown = ", ".join(os.path.basename(image_path(folder_name, *key)) for key in failed[:5])
+        printer.line(sub_name, f"xong, {len(failed)} ảnh lỗi: {shown}" + (" ..." if len(failed) > 5 else ""))
+        return False
+    printer.line(sub_name, f"xong ({len(errors)} ảnh không tồn tại)" if errors else "xong")
+    return True
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    rate = args.rate * 1024
+    bandwidth.set_profile(NORMAL_PROFILE._replace(name="cli", background_rate=rate, contended_rate=rate))
+    request_limiter.set_rate(args.request_rate, max(1, args.request_rate * 2))
+    init_db()
+    printer = ProgressPrinter()
+    jobs = [JobControl(actor) for actor in args.actors]
+    pool = ThreadPoolExecutor(max_workers=args.parallel)
+    futures = [pool.submit(download_actor, actor, args.pages, printer, job) for actor, job in zip(args.actors, jobs)]
+    try:
+        results = [future.result() for future in futures]
+    except KeyboardInterrupt:
+        for job in jobs:  # File đang tải dừng ở khối kế tiếp, giữ .part để lần sau tải tiếp
+            job.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        db.close()
+        return EXIT_INTERRUPTED
+    pool.shutdown()
+    db.close()  # Ghi nốt hàng chờ manifest
+    log_transport_stats()
+    failed = results.count(False)
+    print(f"{len(results) - failed}/{len(results)} diễn viên tải xong", file=sys.stderr)
+    return EXIT_OK if not failed else EXIT_ERRORS
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1128 @@
+import os
+import time
+import threading
+import sqlite3
+import queue
+import itertools
+import bisect
+import re
+import logging
+import random
+from urllib.parse import urljoin, urlsplit
+from collections import Counter, deque, namedtuple
+from concurrent.futures import Future, CancelledError, as_completed
+
+from httpbase import MAX_CONNECTIONS_PER_HOST, log_transport_stats
+
+# Phần tải không import Kivy: cấu hình, DB, HTTP và hàng đợi tải dùng chung cho giao diện (main.py)
+# và bản chạy không giao diện (cli.py).
+
+# ===== GLOBALS & CONFIG =====
+BASE_URL = os.environ.get("JJDL_BASE_URL", "https://jjgirls.com/japanese")  # Đổi được để chạy với server giả lập
+IMAGES_PER_PAGE = 12
+PARENT_FOLDER = "Picture AV"
+THUMBNAIL_FOLDER = os.path.join(PARENT_FOLDER, "thumbnail")
+THUMBNAIL_CACHE_FOLDER = os.path.join(THUMBNAIL_FOLDER, "cache")
+DB_FILE = os.path.join(PARENT_FOLDER, "actors.db")
+
+DETECTION_THRESHOLD = 5 * 1024
+DOWNLOAD_THRESHOLD = 5 * 1024
+CHUNK_SIZE = 64 * 1024  # Kích thước mỗi khối khi ghi luồng xuống đĩa
+PARTIAL_SUFFIX = ".part"  # File tạm, đổi tên khi tải xong
+PAGE_COUNT_TTL = 24 * 3600  # Thời gian (giây) tin dùng số trang đã lưu trong DB
+MISSING_TTL = 24 * 3600  # Thời gian (giây) nhớ một ảnh không tồn tại trước khi thử lại
+DB_FLUSH_INTERVAL = 0.5  # Số giây gom các lần ghi manifest trước khi commit một lượt
+DB_BATCH_SIZE = 200  # Hàng chờ ghi đạt ngần này dòng thì commit ngay
+DB_CACHED_STATEMENTS = 64  # Số câu lệnh đã biên dịch giữ lại trên kết nối DB
+METERED_CHECK_INTERVAL = 60  # Số giây giữa hai lần hỏi mạng có tính phí (Android)
+METERED_MODE = None  # None = tự nhận biết mạng tính phí (Android), True/False = ép bật/tắt chế độ tiết kiệm dữ liệu
+FOREGROUND_BYTE_RATE = 0  # Byte/giây cho ảnh đang xem và trang kề (0 = không giới hạn)
+BACKGROUND_BYTE_RATE = 4 * 1024 * 1024  # Byte/giây cho "Tải trang", "Tải hết", "Tải từ"
+CONTENDED_BYTE_RATE = 512 * 1024  # Byte/giây cho việc tải nền trong lúc ảnh đang xem còn đang tải
+METERED_BYTE_RATE = 256 * 1024  # Byte/giây cho việc tải nền trên mạng tính phí
+METERED_CONTENDED_BYTE_RATE = 64 * 1024
+BANDWIDTH_BURST = 0.25  # Số giây băng thông được dồn lại sau một lúc rảnh
+MAX_THREADS = 4  # Số luồng tải đồng thời lúc khởi động (sau đó ConcurrencyController tự điều chỉnh)
+MIN_CONCURRENCY = 1  # Sàn của bộ điều khiển AIMD
+# Trần của bộ điều khiển AIMD: mọi ảnh đều tới cùng một host nên MAX_CONNECTIONS_PER_HOST (httpbase) mới là
+# giới hạn thật; muốn tải song song nhiều hơn thì nâng MAX_CONNECTIONS_PER_HOST, không phải số này
+MAX_CONCURRENCY = MAX_CONNECTIONS_PER_HOST
+CONCURRENCY_SAMPLE = 16  # Số lượt tải xong cho mỗi lần đánh giá
+CONCURRENCY_ERROR_RATE = 0.25  # Tỉ lệ lỗi vượt mức này -> giảm một nửa
+CONCURRENCY_LATENCY_FACTOR = 2.0  # Thời gian tải trung vị gấp từng này lần mức tốt nhất -> giảm
+RETRY_ATTEMPTS = 4  # Số lần thử tối đa một request khi gặp lỗi tạm thời (mất kết nối, timeout, 429/5xx)
+RETRY_BASE_DELAY = 0.5  # Giây chờ gốc trước lần thử lại đầu tiên, nhân đôi sau mỗi lần (có jitter)
+RETRY_MAX_DELAY = 10  # Trần thời gian chờ giữa hai lần thử (kể cả Retry-After của server)
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # Mã HTTP được coi là tạm thời
+REQUEST_RATE = 16  # Số request tối đa mỗi giây, dùng chung cho mọi luồng
+REQUEST_BURST = 32  # Số request được dồn ra cùng lúc sau một lúc rảnh
+
+# Độ ưu tiên trong hàng đợi tải (số nhỏ chạy trước)
+PRIORITY_VIEW = 0  # Ảnh đang xem / xem trước
+PRIORITY_PREFETCH = 1  # Trang kề trang đang xem
+PRIORITY_PAGE = 2  # Nút "Tải trang"
+PRIORITY_BULK = 3  # "Tải hết", "Tải từ"
+
+# Trạng thái từng ảnh trong bảng images (manifest)
+STATUS_DONE = "done"
+STATUS_MISSING = "missing"  # 404 hoặc quá nhỏ
+STATUS_PARTIAL = "partial"  # Còn file .part để tải tiếp
+STATUS_FAILED = "failed"
+
+DownloadOutcome = namedtuple("DownloadOutcome", "status error size etag last_modified timed_out", defaults=(False,))
+ManifestEntry = namedtuple("ManifestEntry", "status size etag last_modified last_attempt")
+
+# ===== DB =====
+# Một kết nối SQLite (WAL) sống suốt phiên, dùng chung cho mọi luồng qua một lock. sqlite3 giữ sẵn
+# câu lệnh đã biên dịch theo từng kết nối nên các câu lặp lại không phải prepare lại.
+# Ghi manifest và negative cache vào hàng chờ, commit thành một transaction mỗi DB_FLUSH_INTERVAL giây;
+# mọi lần đọc đẩy hàng chờ xuống trước để luôn thấy dữ liệu vừa ghi.
+def create_schema(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS actors
+                 (name TEXT PRIMARY KEY, folder_path TEXT, thumbnail_path TEXT,
+                  page_count INTEGER, page_count_checked REAL)''')
+    # Nâng cấp DB cũ chưa có cột số trang
+    c.execute("PRAGMA table_info(actors)")
+    columns = {row[1] for row in c.fetchall()}
+    for column, decl in (("page_count", "INTEGER"), ("page_count_checked", "REAL")):
+        if column not in columns:
+            c.execute(f"ALTER TABLE actors ADD COLUMN {column} {decl}")
+    c.execute('''CREATE TABLE IF NOT EXISTS images
+                 (actor TEXT, page INTEGER, img_num INTEGER, url TEXT, local_path TEXT, size INTEGER,
+                  etag TEXT, last_modified TEXT, status TEXT, last_attempt REAL,
+                  PRIMARY KEY (actor, page, img_num))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS missing_images
+                 (url TEXT PRIMARY KEY, slug TEXT, page INTEGER, img_num INTEGER, checked REAL)''')
+    conn.commit()
+
+class Database:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self.pending = []  # (câu SQL, tham số) chờ commit theo lô
+        self.flush_timer = None
+
+    def connect(self):
+        with self.lock:
+            if self.conn is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")  # WAL: chỉ fsync khi checkpoint, vẫn an toàn khi app bị tắt
+                create_schema(conn)
+                self.conn = conn
+            return self.conn
+
+    def query(self, sql, params=()):
+        with self.lock:
+            self._flush()
+            return self.connect().execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        # Ghi ngay: dữ liệu người dùng thấy liền (lịch sử, số trang)
+        with self.lock:
+            self._flush()  # Giữ đúng thứ tự với các lần ghi đang chờ
+            conn = self.connect()
+            with conn:
+                conn.execute(sql, params)
+
+    def write_later(self, sql, rows):
+        with self.lock:
+            self.pending.extend((sql, row) for row in rows)
+            if len(self.pending) >= DB_BATCH_SIZE:
+                self._flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(DB_FLUSH_INTERVAL, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        with self.lock:
+            try:
+                self._flush()
+            except sqlite3.Error as e:
+                logging.error(f"Error writing batched rows to database: {e}")
+
+    def _flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        conn = self.connect()
+        with conn:  # Một transaction cho cả lô
+            for sql, params in pending:
+                conn.execute(sql, params)
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+db = Database(DB_FILE)
+
+def init_db():
+    db.connect()
+
+def update_actor_config(actor_name, folder_path, thumbnail_path):
+    db.execute('''INSERT INTO actors (name, folder_path, thumbnail_path) VALUES (?, ?, ?)
+                  ON CONFLICT(name) DO UPDATE SET folder_path = excluded.folder_path,
+                                                  thumbnail_path = excluded.thumbnail_path''',
+               (actor_name, folder_path, thumbnail_path))
+    actor_index.add(actor_name, folder_path, thumbnail_path)
+
+def get_cached_page_count(actor_name):
+    rows = db.query("SELECT page_count, page_count_checked FROM actors WHERE name = ?", (actor_name,))
+    if not rows or rows[0][0] is None:
+        return None, None
+    return rows[0][0], rows[0][1]
+
+def update_page_count(actor_name, folder_path, page_count):
+    db.execute('''INSERT INTO actors (name, folder_path, page_count, page_count_checked) VALUES (?, ?, ?, ?)
+                  ON CONFLICT(name) DO UPDATE SET page_count = excluded.page_count,
+                                                  page_count_checked = excluded.page_count_checked''',
+               (actor_name, folder_path, page_count, time.time()))
+    actor_index.add(actor_name, folder_path)
+
+def record_images(rows):
+    # rows: (actor, page, img_num, url, local_path, size, etag, last_modified, status, last_attempt)
+    db.write_later('''INSERT OR REPLACE INTO images
+                      (actor, page, img_num, url, local_path, size, etag, last_modified, status, last_attempt)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+def get_manifest(actor_name, first_page, last_page):
+    rows = db.query('''SELECT page, img_num, status, size, etag, last_modified, last_attempt FROM images
+                       WHERE actor = ? AND page BETWEEN ? AND ?''', (actor_name, first_page, last_page))
+    return {(row[0], row[1]): ManifestEntry(*row[2:]) for row in rows}
+
+def load_missing_images(ttl):
+    db.execute("DELETE FROM missing_images WHERE checked < ?", (time.time() - ttl,))
+    return dict(db.query("SELECT url, checked FROM missing_images"))
+
+def save_missing_image(url, slug, page, img_num, checked):
+    db.write_later("INSERT OR REPLACE INTO missing_images (url, slug, page, img_num, checked) VALUES (?, ?, ?, ?, ?)",
+                   [(url, slug, page, img_num, checked)])
+
+def get_actor_history():
+    rows = db.query("SELECT name, folder_path, thumbnail_path FROM actors")
+    return [{"name": row[0], "folder_path": row[1], "thumbnail_path": row[2]} for row in rows]
+
+# ===== ACTOR INDEX =====
+# Tìm diễn viên theo chuỗi con mà không quét cả bảng: index trigram trong RAM, nạp từ DB một lần,
+# thêm tên mới khi diễn viên được lưu. Kết quả giữ thứ tự chữ cái (không phân biệt hoa thường).
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class ActorIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = None  # Tên sắp theo thứ tự hiển thị; None = chưa nạp
+        self.keys = []  # casefold() của từng tên, cùng thứ tự
+        self.postings = {}  # trigram -> tập tên chứa trigram đó
+        self.details = {}  # tên -> (thư mục ảnh, đường dẫn ảnh bìa)
+
+    def _ensure_loaded(self):
+        if self.names is None:
+            try:
+                actors = get_actor_history()
+            except sqlite3.Error as e:
+                logging.warning(f"Cannot load actor history: {e}")
+                return False
+            self.names = []
+            for actor in actors:
+                self._add(actor["name"], actor["folder_path"], actor["thumbnail_path"])
+        return True
+
+    def _add(self, name, folder_path=None, thumbnail_path=None):
+        old_folder, old_thumbnail = self.details.get(name, (None, None))
+        self.details[name] = (folder_path or old_folder, thumbnail_path or old_thumbnail)
+        key = name.casefold()
+        index = bisect.bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.names[index] == name:
+                return
+            index += 1
+        self.keys.insert(index, key)
+        self.names.insert(index, name)
+        for trigram in trigrams(key):
+            self.postings.setdefault(trigram, set()).add(name)
+
+    def add(self, name, folder_path=None, thumbnail_path=None):
+        with self.lock:
+            if self.names is not None:  # Chưa nạp thì lần nạp đầu sẽ đọc từ DB
+                self._add(name, folder_path, thumbnail_path)
+
+    def cover(self, name):
+        # (ảnh xem trước trên đĩa, đường dẫn ảnh bìa), None nếu diễn viên chưa có ảnh nào trên đĩa
+        with self.lock:
+            folder_path, thumbnail_path = self.details.get(name, (None, None))
+        if not folder_path:
+            return None
+        preview_path = image_path(folder_path, 1, 1)
+        if not os.path.exists(preview_path):
+            return None
+        return preview_path, thumbnail_path or cover_path(name)
+
+    def search(self, text):
+        query = text.strip().casefold()
+        with self.lock:
+            if not self._ensure_loaded():
+                return []
+            if not query:
+                return list(self.names)
+            if len(query) < 3:  # Chưa đủ một trigram: lọc tuần tự trên danh sách đã sắp
+                return [name for name, key in zip(self.names, self.keys) if query in key]
+            postings = sorted((self.postings.get(trigram, set()) for trigram in trigrams(query)), key=len)
+            candidates = set.intersection(*postings)
+        matches = [name for name in candidates if query in name.casefold()]  # Trigram khớp chưa chắc liền nhau
+        matches.sort(key=str.casefold)
+        return matches
+
+actor_index = ActorIndex()
+
+# ===== NEGATIVE CACHE =====
+# Nhớ các ảnh không tồn tại (404 / chuyển hướng 404.Not.Found.svg) trong MISSING_TTL giây,
+# lưu vào DB để lần chạy sau không phải hỏi lại server.
+class ImageMissing(Exception):
+    pass
+
+IMAGE_URL_PATTERN = re.compile(r"/([^/]+)/(\d+)/[^/]+-(\d+)\.jpg$")
+
+def parse_image_url(url):
+    match = IMAGE_URL_PATTERN.search(url)
+    if not match:
+        return None, None, None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+class MissingCache:
+    def __init__(self, ttl=MISSING_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = None  # url -> thời điểm kiểm tra; nạp từ DB ở lần dùng đầu
+
+    def _ensure_loaded(self):
+        if self.entries is None:
+            try:
+                self.entries = load_missing_images(self.ttl)
+            except sqlite3.Error as e:
+                logging.warning(f"Cannot load missing image cache: {e}")
+                return {}
+        return self.entries
+
+    def is_missing(self, url):
+        with self.lock:
+            checked = self._ensure_loaded().get(url)
+        return checked is not None and time.time() - checked < self.ttl
+
+    def add(self, url):
+        now = time.time()
+        with self.lock:
+            self._ensure_loaded()[url] = now
+        try:
+            save_missing_image(url, *parse_image_url(url), now)
+        except sqlite3.Error as e:
+            logging.error(f"Error saving missing image {url}: {e}")
+
+missing_cache = MissingCache()
+
+# ===== RETRY & RATE LIMIT =====
+# Lỗi tạm thời (mất kết nối, timeout, 429/5xx) được thử lại sau một khoảng chờ tăng theo hàm mũ
+# có jitter đầy đủ, để các luồng không cùng thử lại một lúc; 404 và lỗi HTTP khác trả về ngay.
+# Mọi request đi qua một token bucket chung nên đợt "Tải hết" không dội vào server.
+class RetryPolicy:
+    def __init__(self, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_transient(self, error):
+        from transport import is_transient
+        return is_transient(error)
+
+    def should_retry(self, error, attempt):
+        return attempt + 1 < self.attempts and self.is_transient(error)
+
+    def delay(self, attempt, error=None):
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))  # Full jitter
+
+    def wait(self, attempt, error, url):
+        delay = self.delay(attempt, error)
+        logging.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 2}/{self.attempts}): {error}")
+        time.sleep(delay)
+
+    def run(self, fn, url):
+        for attempt in itertools.count():
+            try:
+                return fn()
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                self.wait(attempt, e, url)
+
+class TokenBucket:
+    # rate đơn vị mỗi giây, dồn tối đa capacity đơn vị. acquire(n) lớn hơn capacity vẫn được cấp
+    # khi bucket đầy (mắc nợ phần dư), nên không bao giờ chặn vĩnh viễn. rate 0 = không giới hạn.
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate, capacity):
+        with self.lock:
+            self._refill()  # Phần đã tích luỹ tính theo tốc độ cũ
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = min(self.tokens, capacity)
+
+    def acquire(self, amount=1):
+        while True:
+            with self.lock:
+                if self.rate <= 0:
+                    return
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)  # Ngủ ngoài khoá để luồng khác vẫn nạp/lấy được
+
+retry_policy = RetryPolicy()
+request_limiter = TokenBucket(REQUEST_RATE, REQUEST_BURST)
+
+# ===== JOB CONTROL =====
+# Mỗi lượt tải (nút "Tải trang", "Tải hết", "Tải từ") có một JobControl riêng. Không có vòng lặp hỏi:
+# đổi trạng thái thì báo cho các listener; download_engine nhận tin và tự dừng/chạy tiếp các file của job.
+class JobCancelled(CancelledError):
+    pass
+
+class JobControl:
+    def __init__(self, name, target=None, args=()):
+        self.name = name
+        self.target = target  # target(*args, job=self), chạy lại được sau khi huỷ
+        self.args = args
+        self.lock = threading.Lock()
+        self.paused = False
+        self.cancelled = False
+        self.running = False
+        self.listeners = []
+
+    def add_listener(self, listener):
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def pause(self):
+        self._set(paused=True)
+
+    def resume(self):
+        self._set(paused=False)
+
+    def cancel(self):
+        self._set(paused=False, cancelled=True)
+
+    def reset(self):
+        self._set(paused=False, cancelled=False)
+
+    def _set(self, **state):
+        with self.lock:
+            for name, value in state.items():
+                setattr(self, name, value)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(self)
+
+    def start(self):
+        self.reset()
+        self.running = True
+        download_jobs.add(self)
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            self.target(*self.args, job=self)
+        finally:
+            self.running = False
+            if not self.cancelled:  # Lượt bị huỷ được giữ lại để "Resume" chạy lại
+                download_jobs.remove(self)
+
+class JobRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = []
+
+    def add(self, job):
+        with self.lock:
+            # Lượt mới thay cho các lượt đã huỷ xong còn giữ lại
+            self.jobs = [j for j in self.jobs if j is not job and (j.running or not j.cancelled)]
+            self.jobs.append(job)
+
+    def remove(self, job):
+        with self.lock:
+            if job in self.jobs:
+                self.jobs.remove(job)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.jobs)
+
+download_jobs = JobRegistry()
+
+# ===== UTILS =====
+def validate_actor_input(actor_input):
+    if not actor_input or len(actor_input.strip()) < 3 or not actor_input.replace(" ", "").isalnum():
+        return False, "Tên diễn viên phải dài ít nhất 3 ký tự và chỉ chứa chữ/số!"
+    return True, ""
+
+def process_actor_input(actor_input):
+    slug = actor_input.lower().replace(" ", "-")
+    tokens = slug.split('-')
+    if len(tokens) == 4:
+        sub_name = f"{tokens[0].title()} {tokens[1].title()} & {tokens[2].title()} {tokens[3].title()}"
+    else:
+        sub_name = slug.replace('-', ' ').title()
+    folder_name = os.path.join(PARENT_FOLDER, sub_name)
+    return slug, folder_name, sub_name
+
+def image_url(slug, page, img_num):
+    return f"{BASE_URL}/{slug}/{page}/{slug}-{img_num}.jpg"
+
+def image_path(folder_name, page, img_num):
+    return os.path.join(folder_name, f"{os.path.basename(folder_name)}-{page}-{img_num}.jpg")
+
+def cover_path(sub_name):
+    return os.path.join(THUMBNAIL_FOLDER, f"{sub_name.lower().replace(' ', '-')}-thumb.jpg")
+
+def open_url(url, method="GET", headers=None, stream=True, timeout=10):
+    # Mọi request ảnh đi qua đây: kiểm tra negative cache trước, và nhận ra chuyển hướng
+    # tới 404.Not.Found.svg từ header Location mà không cần theo nó.
+    from transport import TransientHTTPError, get_session
+    if missing_cache.is_missing(url):
+        raise ImageMissing(url)
+    session = get_session()
+    request_limiter.acquire()
+    response = session.request(method, url, headers=headers, stream=stream, timeout=timeout, allow_redirects=False)
+    if response.is_redirect:
+        location = response.headers.get("Location", "")
+        response.content  # Thân chuyển hướng rất nhỏ, đọc hết để giữ kết nối
+        response.close()
+        if "404.Not.Found.svg" in location:
+            missing_cache.add(url)
+            raise ImageMissing(url)
+        request_limiter.acquire()
+        response = session.request(method, urljoin(url, location), headers=headers, stream=stream, timeout=timeout)
+    if response.status_code == 404 or "404.Not.Found.svg" in response.url:
+        response.content
+        response.close()
+        missing_cache.add(url)
+        raise ImageMissing(url)
+    if response.status_code in RETRY_STATUSES:
+        response.content
+        response.close()
+        raise TransientHTTPError(response)
+    return response
+
+def probe_image(url, threshold=DETECTION_THRESHOLD, timeout=10):
+    # Kiểm tra ảnh có tồn tại mà không tải thân: HEAD, nếu server không hỗ trợ thì GET 1 byte.
+    # Lỗi tạm thời được thử lại; hết lượt thử thì ném lỗi ra (không coi là "không có ảnh").
+    def attempt():
+        with open_url(url, method="HEAD", stream=False, timeout=timeout) as response:
+            if response.status_code not in (405, 501):
+                response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                return not (length and length.isdigit() and int(length) < threshold)
+        with open_url(url, headers={"Range": "bytes=0-0"}, timeout=timeout) as response:
+            response.raise_for_status()
+            response.content
+            if response.status_code == 206:
+                total = parse_content_range(response.headers.get("Content-Range"))
+            else:
+                length = response.headers.get("Content-Length")
+                total = int(length) if length and length.isdigit() else None
+            return total is None or total >= threshold
+    try:
+        return retry_policy.run(attempt, url)
+    except ImageMissing:
+        return False
+
+def discover_page_count(page_exists, hint=None):
+    # Dò mũ (1, 2, 4, 8...) rồi tìm nhị phân: O(log n) lần kiểm tra thay vì n+1.
+    # hint: số trang đã biết từ lần trước, thường chỉ cần 2 lần kiểm tra.
+    low, high = 0, None  # Trang low tồn tại (0 = chưa biết), trang high không tồn tại
+    if hint and hint > 0:
+        if page_exists(hint):
+            low = hint
+        else:
+            high = hint
+    if high is None:
+        step = 1
+        high = low + step
+        while page_exists(high):
+            low = high
+            step *= 2
+            high = low + step
+    while high - low > 1:
+        mid = (low + high) // 2
+        if page_exists(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+def parse_content_range(value):
+    # "bytes 100-999/1000" -> 1000; None nếu không rõ tổng
+    try:
+        total = value.rsplit("/", 1)[1]
+        return int(total) if total != "*" else None
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def fetch_to_file(url, save_path, threshold=DOWNLOAD_THRESHOLD, timeout=10, validator=None, checkpoint=None,
+                  throttle=None):
+    # validator: ETag/Last-Modified lần trước, gửi kèm If-Range để chỉ tải tiếp khi file trên server chưa đổi
+    # checkpoint(): gọi trước mỗi khối, chờ khi tạm dừng và báo JobCancelled khi bị huỷ (giữ file .part)
+    # throttle(n): gọi sau mỗi khối n byte, chờ cho đúng băng thông được cấp
+    # Lỗi tạm thời được thử lại theo retry_policy, mỗi lần tải tiếp từ phần .part đã có.
+    from transport import IncompleteDownload, is_timeout
+    name = os.path.basename(save_path)
+    timed_out = False
+    for attempt in itertools.count():
+        try:
+            outcome = _fetch_to_file_once(url, save_path, threshold, timeout, validator, checkpoint, throttle)
+            return outcome._replace(timed_out=timed_out)  # Báo cho ConcurrencyController dù lần sau thành công
+        except Exception as e:
+            timed_out = timed_out or is_timeout(e)
+            if not retry_policy.should_retry(e, attempt):
+                if isinstance(e, IncompleteDownload):
+                    return e.outcome._replace(timed_out=timed_out)
+                logging.error(f"Error downloading {url}: {e}")
+                if is_timeout(e):
+                    return DownloadOutcome(STATUS_FAILED, f"{name} (hết thời gian chờ)", None, None, None, True)
+                return DownloadOutcome(STATUS_FAILED, f"{name} ({str(e)})", None, None, None, timed_out)
+            if isinstance(e, IncompleteDownload):
+                validator = e.outcome.etag or e.outcome.last_modified or validator
+            retry_policy.wait(attempt, e, url)
+
+def _fetch_to_file_once(url, save_path, threshold, timeout, validator, checkpoint, throttle):
+    from transport import IncompleteDownload
+    name = os.path.basename(save_path)
+    part_path = save_path + PARTIAL_SUFFIX
+    etag = last_modified = None
+    try:
+        if checkpoint is not None:  # Không thử lại một lượt tải đã bị huỷ trong lúc chờ
+            checkpoint()
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+        if resume_from and validator:
+            headers["If-Range"] = validator
+        with open_url(url, headers=headers, timeout=timeout) as response:
+            if response.status_code == 416:  # File tạm không khớp với server -> tải lại từ đầu
+                os.remove(part_path)
+                return _fetch_to_file_once(url, save_path, threshold, timeout, None, checkpoint, throttle)
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if response.status_code == 206:
+                mode = "ab"
+                total = parse_content_range(response.headers.get("Content-Range"))
+            else:  # Server bỏ qua Range -> ghi đè từ đầu
+                mode = "wb"
+                length = response.headers.get("Content-Length")
+                total = int(length) if length and length.isdigit() else None
+            if response.headers.get("Content-Encoding"):
+                total = None
+            if total is not None and total < threshold:  # Biết trước là quá nhỏ -> không ghi ra đĩa
+                response.content
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                return DownloadOutcome(STATUS_MISSING, f"{name} (không đủ kích thước)", total, etag, last_modified)
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if checkpoint is not None:
+                        checkpoint()
+                    f.write(chunk)
+                    if throttle is not None:
+                        throttle(len(chunk))
+        size = os.path.getsize(part_path)
+        if total is not None and size < total:  # Mất kết nối giữa chừng, giữ file tạm để tải tiếp
+            raise IncompleteDownload(DownloadOutcome(STATUS_PARTIAL, f"{name} (tải dở {size}/{total} bytes)",
+                                                     size, etag, last_modified))
+        if size < threshold:
+            os.remove(part_path)
+            return DownloadOutcome(STATUS_MISSING, f"{name} (không đủ kích thước)", size, etag, last_modified)
+        os.replace(part_path, save_path)
+        return DownloadOutcome(STATUS_DONE, None, size, etag, last_modified)
+    except ImageMissing:
+        return DownloadOutcome(STATUS_MISSING, f"{name} (không tồn tại)", 0, None, None)
+    except JobCancelled:
+        size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return DownloadOutcome(STATUS_PARTIAL, f"{name} (đã huỷ)", size, etag, last_modified)
+
+# ===== CONCURRENCY =====
+# AIMD: sau mỗi CONCURRENCY_SAMPLE lượt tải, có timeout hoặc nhiều lỗi thì giảm một nửa, thời gian tải phình ra
+# mà thông lượng không tăng (hàng đợi ở mạng) thì giảm 1/4, thông lượng còn tăng thì thêm 1 luồng.
+ConcurrencyDecision = namedtuple("ConcurrencyDecision", "limit throughput latency error_rate timeout_rate reason")
+
+class ConcurrencyController:
+    def __init__(self, initial=MAX_THREADS, floor=MIN_CONCURRENCY, ceiling=MAX_CONCURRENCY,
+                 per_host=MAX_CONNECTIONS_PER_HOST, sample=CONCURRENCY_SAMPLE):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.per_host = per_host
+        self.sample = sample
+        self.lock = threading.Lock()
+        self.limit = max(floor, min(ceiling, initial))
+        self.samples = []  # (thời gian tải, số byte, lỗi, timeout)
+        self.window_start = time.perf_counter()
+        self.last_throughput = None
+        self.best_latency = None
+        self.listeners = []
+        self.last_decision = ConcurrencyDecision(self.limit, None, None, 0.0, 0.0, "initial")
+
+    def decision(self):
+        with self.lock:
+            return self.last_decision
+
+    def record(self, elapsed, nbytes, failed=False, timed_out=False):
+        with self.lock:
+            self.samples.append((elapsed, nbytes or 0, failed, timed_out))
+            if len(self.samples) < self.sample:
+                return
+            decision = self._decide()
+            changed = decision.limit != self.limit
+            self.limit = decision.limit
+            self.last_decision = decision
+            listeners = list(self.listeners)
+        if changed:
+            logging.info(f"Concurrency -> {decision.limit} ({decision.reason}, "
+                         f"{(decision.throughput or 0) / 1024:.0f} KiB/s, p50 {decision.latency:.2f}s, "
+                         f"errors {decision.error_rate:.0%}, timeouts {decision.timeout_rate:.0%})")
+            for listener in listeners:
+                listener(decision)
+
+    def _decide(self):
+        now = time.perf_counter()
+        samples, self.samples = self.samples, []
+        elapsed = max(now - self.window_start, 1e-6)
+        self.window_start = now
+        throughput = sum(nbytes for _, nbytes, _, _ in samples) / elapsed
+        latency = sorted(t for t, _, _, _ in samples)[len(samples) // 2]
+        error_rate = sum(1 for _, _, failed, _ in samples if failed) / len(samples)
+        timeout_rate = sum(1 for _, _, _, timed_out in samples if timed_out) / len(samples)
+        ceiling = min(self.ceiling, self.per_host)  # Mọi ảnh đều tới cùng một host
+        if timeout_rate > 0 or error_rate > CONCURRENCY_ERROR_RATE:
+            limit, reason = max(self.floor, self.limit // 2), "errors"
+        elif (self.best_latency is not None and latency > self.best_latency * CONCURRENCY_LATENCY_FACTOR
+              and throughput < self.last_throughput * 0.9):  # Chờ lâu hơn mà không tải nhanh hơn
+            limit, reason = max(self.floor, self.limit * 3 // 4), "latency"
+        elif self.last_throughput is None or throughput >= self.last_throughput * 0.95:
+            limit, reason = min(ceiling, self.limit + 1), "increase"
+        else:
+            limit, reason = self.limit, "plateau"
+        if error_rate == 0:  # Mức tốt nhất được quên dần để theo kịp khi mạng đổi
+            self.best_latency = latency if self.best_latency is None else min(latency, self.best_latency * 1.1)
+        # Thông lượng trung bình trượt: một cửa sổ nhiễu không làm lật quyết định
+        self.last_throughput = throughput if self.last_throughput is None else 0.7 * self.last_throughput + 0.3 * throughput
+        return ConcurrencyDecision(limit, throughput, latency, error_rate, timeout_rate, reason)
+
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+concurrency = ConcurrencyController()
+
+# ===== BANDWIDTH =====
+# Hai token bucket theo byte: tiền cảnh (ảnh đang xem, trang kề) và nền ("Tải trang", "Tải hết").
+# Khi ảnh đang xem còn đang tải, việc nền bị hạ xuống CONTENDED_BYTE_RATE để nhường đường truyền.
+# Trên mạng tính phí: việc nền chậm hơn nữa, "Tải hết"/"Tải từ" hoãn tới khi có mạng thường,
+# và làm ấm trang kề chỉ lấy trang kế tiếp từ đĩa.
+BandwidthProfile = namedtuple("BandwidthProfile",
+                              "name foreground_rate background_rate contended_rate defer_bulk prefetch_depth "
+                              "prefetch_download")
+
+NORMAL_PROFILE = BandwidthProfile("normal", FOREGROUND_BYTE_RATE, BACKGROUND_BYTE_RATE, CONTENDED_BYTE_RATE,
+                                  False, None, True)
+METERED_PROFILE = BandwidthProfile("metered", FOREGROUND_BYTE_RATE, METERED_BYTE_RATE, METERED_CONTENDED_BYTE_RATE,
+                                   True, 1, False)
+
+_metered_state = {"checked": 0.0, "metered": False}
+
+def is_metered_connection():
+    # Android: hỏi ConnectivityManager qua pyjnius; nền tảng khác coi như mạng không tính phí
+    if "ANDROID_ARGUMENT" not in os.environ:
+        return False
+    now = time.time()
+    if now - _metered_state["checked"] < METERED_CHECK_INTERVAL:
+        return _metered_state["metered"]
+    try:
+        from jnius import autoclass
+        activity = autoclass("org.kivy.android.PythonActivity").mActivity
+        context = autoclass("android.content.Context")
+        manager = activity.getSystemService(context.CONNECTIVITY_SERVICE)
+        _metered_state["metered"] = bool(manager.isActiveNetworkMetered())
+    except Exception as e:
+        logging.warning(f"Cannot query network state: {e}")
+    _metered_state["checked"] = now
+    return _metered_state["metered"]
+
+def is_foreground(priority):
+    return priority <= PRIORITY_PREFETCH
+
+class BandwidthShaper:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile = NORMAL_PROFILE
+        self.foreground = TokenBucket(0, 0)
+        self.background = TokenBucket(0, 0)
+        self.foreground_active = 0  # Số file tiền cảnh đang tải
+        self.listeners = []
+        self._apply()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def refresh(self):
+        # Gọi định kỳ: đổi profile khi mạng chuyển giữa Wi-Fi và di động
+        metered = is_metered_connection() if METERED_MODE is None else METERED_MODE
+        return self.set_profile(METERED_PROFILE if metered else NORMAL_PROFILE)
+
+    def set_profile(self, profile):
+        with self.lock:
+            if profile is self.profile:
+                return profile
+            self.profile = profile
+            self._apply()
+        logging.info(f"Bandwidth profile -> {profile.name}")
+        for listener in list(self.listeners):
+            listener(profile)
+        return profile
+
+    def _apply(self):
+        # Gọi khi đang giữ lock
+        profile = self.profile
+        background_rate = profile.contended_rate if self.foreground_active else profile.background_rate
+        self.foreground.set_rate(profile.foreground_rate, profile.foreground_rate * BANDWIDTH_BURST)
+        self.background.set_rate(background_rate, background_rate * BANDWIDTH_BURST)
+
+    def begin(self, priority):
+        foreground = is_foreground(priority)
+        if foreground:
+            with self.lock:
+                self.foreground_active += 1
+                if self.foreground_active == 1:
+                    self._apply()
+        return foreground
+
+    def end(self, foreground):
+        if foreground:
+            with self.lock:
+                self.foreground_active -= 1
+                if self.foreground_active == 0:
+                    self._apply()
+
+    def throttle(self, priority, nbytes):
+        (self.foreground if is_foreground(priority) else self.background).acquire(nbytes)
+
+    def defers(self, priority):
+        return self.profile.defer_bulk and priority >= PRIORITY_BULK
+
+bandwidth = BandwidthShaper()
+
+# ===== DOWNLOAD ENGINE =====
+# Một hàng đợi ưu tiên dùng chung cho mọi nút tải: trang đang xem chen lên trước việc "Tải hết",
+# cùng một file được yêu cầu nhiều lần thì chỉ tải một lần.
+class DownloadTask:
+    def __init__(self, url, save_path, priority, threshold, record, validator, job):
+        self.url = url
+        self.save_path = save_path
+        self.priority = priority
+        self.threshold = threshold
+        self.record = record  # (actor, page, img_num) để ghi manifest, hoặc None
+        self.validator = validator
+        self.requests = Counter({(priority, job): 1})  # (độ ưu tiên, JobControl hoặc None) -> số nơi đang cần file này
+        self.started = False
+        self.aborted = False  # Không còn ai cần trong lúc đang tải -> dừng ở khối kế tiếp
+        self.future = Future()
+
+class DownloadEngine:
+    def __init__(self, controller=concurrency, shaper=bandwidth):
+        self.controller = controller  # Số luồng tải = controller.limit, đổi theo từng quyết định
+        self.shaper = shaper
+        self.workers = []
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)  # Luồng đang tải dở chờ ở đây khi job tạm dừng
+        self.queue = queue.PriorityQueue()
+        self.tasks = {}  # save_path -> DownloadTask chưa xong
+        self.parked = {}  # save_path -> task chưa chạy mà mọi job cần nó đang tạm dừng
+        self.blocked = 0  # Số luồng đang giữ một file tải dở của job tạm dừng
+        self.host_active = Counter()  # host -> số file đang tải (kể cả file đang chờ job tiếp tục)
+        self.host_blocked = Counter()  # host -> số file tải dở đang chờ job tiếp tục, không tính vào giới hạn
+        self.host_waiting = {}  # host -> deque task chờ vì host đã đủ MAX_CONNECTIONS_PER_HOST
+        controller.add_listener(self._on_limit_change)
+        shaper.add_listener(self._on_profile_change)
+        self.seq = itertools.count()  # Cùng độ ưu tiên thì vào trước ra trước
+
+    def submit(self, url, save_path, priority=PRIORITY_BULK, threshold=DOWNLOAD_THRESHOLD, record=None, validator=None,
+               job=None):
+        if job is not None:
+            job.add_listener(self._on_job_change)
+        with self.lock:
+            task = self.tasks.get(save_path)
+            if task is None:
+                task = DownloadTask(url, save_path, priority, threshold, record, validator, job)
+                task.seq = next(self.seq)
+                self.tasks[save_path] = task
+                self._enqueue(task)
+            else:
+                task.requests[(priority, job)] += 1
+                task.aborted = False  # Đang tải dở mà lại có nơi cần -> tải tiếp
+                if priority < task.priority and not task.started:
+                    # Đẩy lên trước; mục cũ trong hàng đợi sẽ bị bỏ qua khi lấy ra
+                    task.priority = priority
+                    self._enqueue(task)
+                self.condition.notify_all()  # Có thể vừa có nơi cần mà không tạm dừng
+            self._ensure_workers()
+            return task.future
+
+    def release(self, save_paths, priority=PRIORITY_BULK, job=None):
+        # Nơi gọi không cần các file này nữa: việc không còn ai cần thì huỷ (đang tải thì dừng ở khối kế tiếp),
+        # còn nơi khác cần thì trả về độ ưu tiên của nơi đó
+        with self.lock:
+            for save_path in save_paths:
+                task = self.tasks.get(save_path)
+                if task is not None and task.requests[(priority, job)] > 0:
+                    self._drop_requests(task, (priority, job), 1)
+
+    def _drop_requests(self, task, key, count):
+        task.requests[key] -= count
+        remaining = [priority for (priority, _), n in task.requests.items() if n > 0]
+        if not remaining:
+            if task.started:
+                task.aborted = True
+                self.condition.notify_all()
+            else:
+                task.future.cancel()
+                task.future.set_running_or_notify_cancel()  # Đánh thức as_completed()/wait() đang chờ future này
+                del self.tasks[task.save_path]
+        elif min(remaining) != task.priority and not task.started:
+            task.priority = min(remaining)
+            self._enqueue(task)
+
+    def _on_job_change(self, job):
+        with self.lock:
+            if job.cancelled:
+                for task in list(self.tasks.values()):
+                    for key in [key for key, n in task.requests.items() if key[1] is job and n > 0]:
+                        self._drop_requests(task, key, task.requests[key])
+            self._unpark()
+
+    def _on_profile_change(self, profile):
+        with self.lock:
+            self._unpark()
+
+    def _unpark(self):
+        for task in self.parked.values():  # Xét lại khi lấy ra khỏi hàng đợi
+            self._enqueue(task)
+        self.parked = {}
+        self.condition.notify_all()
+
+    def _paused(self, task):
+        # Dừng khi mọi nơi cần file này đều là job đang tạm dừng (ảnh đang xem không có job),
+        # hoặc chỉ việc tải hàng loạt cần nó mà profile băng thông đang hoãn việc đó
+        requesters = [key for key, n in task.requests.items() if n > 0]
+        if not requesters:
+            return False
+        if all(job is not None and job.paused for _, job in requesters):
+            return True
+        return self.shaper.defers(min(priority for priority, _ in requesters))
+
+    def _checkpoint(self, task):
+        with self.condition:
+            if self._paused(task) and not task.aborted:
+                # Luồng này đứng chờ: thêm luồng để ảnh đang xem vẫn tải được, thừa thì tự thoát sau
+                host = urlsplit(task.url).netloc
+                self.blocked += 1
+                self.host_blocked[host] += 1
+                self._ensure_workers()
+                self._wake_host(host)
+                while self._paused(task) and not task.aborted:
+                    self.condition.wait()
+                self.blocked -= 1
+                self.host_blocked[host] -= 1
+            if task.aborted:
+                raise JobCancelled(task.save_path)
+
+    def _live_priority(self, task):
+        # task.priority cố định khi đã bắt đầu tải; độ ưu tiên thật là của nơi cần gấp nhất còn lại
+        with self.lock:
+            live = [priority for (priority, _), n in task.requests.items() if n > 0]
+        return min(live) if live else task.priority
+
+    def _host_done(self, host):
+        with self.lock:
+            self.host_active[host] -= 1
+            self._wake_host(host)
+
+    def _wake_host(self, host):
+        waiting = self.host_waiting.get(host)
+        if waiting:
+            self._enqueue(waiting.popleft())  # Xét lại khi lấy ra, có thể đã xong ở nơi khác
+
+    def _enqueue(self, task):
+        # (độ ưu tiên, thứ tự gửi ban đầu, số duy nhất để không bao giờ phải so sánh task)
+        self.queue.put((task.priority, task.seq, next(self.seq), task))
+
+    def _on_limit_change(self, decision):
+        with self.lock:
+            self._ensure_workers()  # Tăng thì thêm luồng ngay; giảm thì luồng thừa tự thoát
+
+    def _ensure_workers(self):
+        while len(self.workers) - self.blocked < self.controller.limit:
+            worker = threading.Thread(target=self._work, daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                if len(self.workers) - self.blocked > self.controller.limit:
+                    self.workers.remove(threading.current_thread())
+                    return
+            priority, _, _, task = self.queue.get()
+            with self.lock:
+                if self.tasks.get(task.save_path) is not task or task.started or priority != task.priority:
+                    continue
+                if self._paused(task):  # Chờ job tiếp tục, luồng rảnh cho việc khác
+                    self.parked[task.save_path] = task
+                    continue
+                host = urlsplit(task.url).netloc
+                if self.host_active[host] - self.host_blocked[host] >= self.controller.per_host:
+                    self.host_waiting.setdefault(host, deque()).append(task)
+                    continue
+                task.started = True
+                self.parked.pop(task.save_path, None)
+                self.host_active[host] += 1
+            if not task.future.set_running_or_notify_cancel():
+                self._host_done(host)
+                continue
+            started = time.perf_counter()
+            foreground = [self.shaper.begin(self._live_priority(task))]
+
+            def throttle(nbytes):
+                # Xét lại mỗi khối: ảnh đang xem nhận file bulk đang tải dở thì phần còn lại chạy ở tiền cảnh
+                priority = self._live_priority(task)
+                if is_foreground(priority) != foreground[0]:
+                    self.shaper.end(foreground[0])
+                    foreground[0] = self.shaper.begin(priority)
+                self.shaper.throttle(priority, nbytes)
+            try:
+                outcome = fetch_to_file(task.url, task.save_path, threshold=task.threshold, validator=task.validator,
+                                        checkpoint=lambda: self._checkpoint(task), throttle=throttle)
+            finally:
+                self.shaper.end(foreground[0])
+            self._host_done(host)
+            if outcome.status != STATUS_PARTIAL or not task.aborted:  # Lượt bị huỷ không phản ánh đường truyền
+                self.controller.record(time.perf_counter() - started, outcome.size,
+                                       failed=outcome.status == STATUS_FAILED, timed_out=outcome.timed_out)
+            if task.record is not None:
+                try:
+                    record_images([(*task.record, task.url, task.save_path, outcome.size, outcome.etag,
+                                    outcome.last_modified, outcome.status, time.time())])
+                except sqlite3.Error as e:
+                    logging.error(f"Error updating manifest for {task.save_path}: {e}")
+            with self.lock:
+                if self.tasks.get(task.save_path) is task:
+                    del self.tasks[task.save_path]
+            if task.aborted:
+                task.future.set_exception(JobCancelled(task.save_path))
+            else:
+                task.future.set_result(outcome.error)
+
+download_engine = DownloadEngine()
+
+# ===== DOWNLOAD JOBS =====
+def discover_pages(slug, folder_name, sub_name):
+    # Số trang của diễn viên: dùng số đã lưu nếu còn mới, không thì dò lại và lưu vào DB.
+    # Lỗi mạng sau khi đã thử lại được ném ra (requests.RequestException), không coi là "hết trang".
+    def page_exists(page):
+        if os.path.exists(image_path(folder_name, page, 1)):
+            return True
+        return probe_image(image_url(slug, page, 1))
+
+    page_count, checked = get_cached_page_count(sub_name)
+    if page_count is None or checked is None or time.time() - checked > PAGE_COUNT_TTL:
+        page_count = discover_page_count(page_exists, hint=page_count)
+        if page_count > 0:
+            update_page_count(sub_name, folder_name, page_count)
+    return page_count
+
+def download_pages(pages, slug, folder_name, sub_name, priority, progress=None, job=None):
+    # Lập kế hoạch từ manifest (một truy vấn), gửi phần còn thiếu vào download_engine và chờ;
+    # trả về danh sách lỗi, None nếu bị huỷ. Huỷ job thì engine tự bỏ/dừng các file của job.
+    # progress(số ảnh xong, tổng số ảnh) được gọi từ luồng đang chờ sau mỗi file.
+    pages = list(pages)
+    manifest = get_manifest(sub_name, pages[0], pages[-1])
+    total_images = len(pages) * IMAGES_PER_PAGE
+    counter = 0
+    errors = []
+    backfill = []
+    save_paths = []
+    futures = []
+    if job is not None and job.cancelled:
+        return None
+    for page in pages:
+        for img_num in range(1, IMAGES_PER_PAGE + 1):
+            entry = manifest.get((page, img_num))
+            if entry is not None and entry.status == STATUS_DONE:
+                counter += 1
+                continue
+            url = image_url(slug, page, img_num)
+            save_path = image_path(folder_name, page, img_num)
+            if entry is None and os.path.exists(save_path):
+                # Ảnh tải trước khi có manifest: ghi nhận một lần, lần sau không cần stat
+                backfill.append((sub_name, page, img_num, url, save_path, os.path.getsize(save_path),
+                                 None, None, STATUS_DONE, time.time()))
+                counter += 1
+                continue
+            if missing_cache.is_missing(url):  # Biết chắc không tồn tại -> không tính vào tổng
+                total_images -= 1
+                continue
+            validator = (entry.etag or entry.last_modified) if entry is not None else None
+            save_paths.append(save_path)
+            futures.append(download_engine.submit(url, save_path, priority, record=(sub_name, page, img_num),
+                                                  validator=validator, job=job))
+    if backfill:
+        record_images(backfill)
+    if progress is not None and total_images:
+        progress(counter, total_images)
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except CancelledError:
+            download_engine.release(save_paths, priority, job)
+            return None
+        if result:
+            errors.append(result)
+        else:
+            counter += 1
+        if progress is not None:
+            progress(counter, total_images)
+    log_transport_stats()
+    return errors
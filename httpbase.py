@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+# Phần HTTP dùng chung cho downloader và transport, không phụ thuộc requests: cấu hình pool,
+# thống kê kết nối (app/CLI đọc được mà không phải nạp requests) và đọc header Retry-After.
+# downloader -> transport -> httpbase, không module nào ở đây import ngược lên.
+
+# Số lượt tải / kết nối keep-alive tối đa tới mỗi host; cũng là trần MAX_CONCURRENCY của downloader
+MAX_CONNECTIONS_PER_HOST = 8
+POOL_HOSTS = 4  # Số host giữ pool kết nối
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# ===== TRANSPORT STATS =====
+class TransportStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}  # conn_id -> {"host", "requests", "handshakes"}
+        self.next_id = 1
+
+    def record(self, host, conn):
+        with self.lock:
+            conn_id = getattr(conn, "_jjdl_conn_id", None)
+            if conn_id is None:
+                conn_id = self.next_id
+                self.next_id += 1
+                conn._jjdl_conn_id = conn_id
+                self.connections[conn_id] = {"host": host, "requests": 0, "handshakes": 0}
+            stats = self.connections[conn_id]
+            stats["requests"] += 1
+            if getattr(conn, "sock", None) is None:  # Kết nối mới hoặc đã bị đóng -> bắt tay lại
+                stats["handshakes"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            per_connection = [dict(conn_id=conn_id, **stats) for conn_id, stats in self.connections.items()]
+        total_requests = sum(c["requests"] for c in per_connection)
+        handshakes = sum(c["handshakes"] for c in per_connection)
+        return {
+            "requests": total_requests,
+            "connections": len(per_connection),
+            "handshakes": handshakes,
+            "reused": total_requests - handshakes,
+            "reuse_ratio": (total_requests - handshakes) / total_requests if total_requests else 0.0,
+            "per_connection": per_connection,
+        }
+
+transport_stats = TransportStats()
+
+def get_transport_stats():
+    return transport_stats.snapshot()
+
+def log_transport_stats():
+    stats = get_transport_stats()
+    logging.info(f"HTTP: {stats['requests']} requests, {stats['connections']} connections, "
+                 f"{stats['handshakes']} handshakes, reuse {stats['reuse_ratio']:.0%}")
+
+# ===== RETRY-AFTER =====
+def parse_retry_after(value):
+    # Retry-After: số giây hoặc ngày giờ HTTP
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,296 @@
+import os
+import io
+import sys
+import glob
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image as PILImage
+from PIL.ExifTags import TAGS
+
+# Module này không import Kivy: tiến trình giải mã của DecodePool chỉ cần PIL.
+
+THUMBNAIL_QUALITY = 85
+DECODE_WORKERS = os.cpu_count() or 1
+DECODE_BATCH = 4  # Số ảnh gửi cho một tiến trình mỗi lần
+
+PixelBuffer = namedtuple("PixelBuffer", "size colorfmt data")
+
+def correct_image_orientation(pil_image):
+    try:
+        exif = pil_image._getexif()
+        if exif is not None:
+            for tag, value in exif.items():
+                if TAGS.get(tag) == 'Orientation':
+                    if value == 3:
+                        pil_image = pil_image.rotate(180, expand=True)
+                    elif value == 6:
+                        pil_image = pil_image.rotate(270, expand=True)
+                    elif value == 8:
+                        pil_image = pil_image.rotate(90, expand=True)
+                    break
+    except Exception as e:
+        logging.warning(f"Error reading EXIF data: {e}")
+    return pil_image
+
+def decode_thumbnail(image_path, size):
+    pil_img = PILImage.open(image_path)
+    if pil_img.format not in ["JPEG", "PNG"]:
+        raise ValueError("Định dạng ảnh không được hỗ trợ")
+    if pil_img.format == "JPEG":
+        pil_img.draft("RGB", (size, size))  # Giải mã thẳng ở 1/2, 1/4, 1/8 kích thước (DCT), không cần ảnh gốc
+    pil_img = correct_image_orientation(pil_img)
+    pil_img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+    return pil_img
+
+def thumbnail_cache_path(image_path, size, stat, cache_folder):
+    # Tên file = hash(đường dẫn, cỡ) + chữ ký (mtime, dung lượng) của ảnh gốc: ảnh gốc đổi thì tên đổi
+    path_key = hashlib.sha1(f"{os.path.abspath(image_path)}|{size}".encode("utf-8")).hexdigest()[:20]
+    ext = ".png" if image_path.lower().endswith(".png") else ".jpg"
+    return os.path.join(cache_folder, f"{path_key}-{stat.st_mtime_ns:x}-{stat.st_size:x}{ext}"), path_key
+
+def make_thumbnail(image_path, size, cache_folder):
+    stat = os.stat(image_path)
+    cache_path, path_key = thumbnail_cache_path(image_path, size, stat, cache_folder)
+    try:
+        cached = PILImage.open(cache_path)
+        cached.load()
+        return cached
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Rebuilding corrupt thumbnail {cache_path}: {e}")
+    pil_img = decode_thumbnail(image_path, size)
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        for stale_path in glob.glob(os.path.join(cache_folder, f"{path_key}-*")):
+            if stale_path != cache_path:
+                os.remove(stale_path)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if cache_path.endswith(".jpg"):
+            pil_img.convert("RGB").save(tmp_path, format="JPEG", quality=THUMBNAIL_QUALITY)
+        else:
+            pil_img.save(tmp_path, format="PNG")
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.error(f"Error saving thumbnail {cache_path}: {e}")
+    return pil_img
+
+def thumbnail_data(image_path, size, cache_folder):
+    # Bytes đã nén của thumbnail trong cache đĩa (tạo nếu chưa có)
+    cache_path, _ = thumbnail_cache_path(image_path, size, os.stat(image_path), cache_folder)
+    try:
+        with open(cache_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    pil_img = make_thumbnail(image_path, size, cache_folder)
+    try:
+        with open(cache_path, "rb") as f:
+            return f.read()
+    except OSError:  # Không ghi được cache đĩa -> nén trong bộ nhớ
+        data = io.BytesIO()
+        pil_img.convert("RGB").save(data, format="JPEG", quality=THUMBNAIL_QUALITY)
+        return data.getvalue()
+
+def cover_is_fresh(image_path, cover_path):
+    # Ảnh bìa mang mtime của ảnh gốc (os.utime), nên hai lần stat là biết ảnh gốc có đổi hay chưa
+    try:
+        return os.stat(cover_path).st_mtime_ns == os.stat(image_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+def make_cover(item, size):
+    # item = (ảnh xem trước, đường dẫn ảnh bìa); tạo lại ảnh bìa nếu cũ, trả về (PixelBuffer, bytes JPEG)
+    image_path, cover_path = item
+    if not cover_is_fresh(image_path, cover_path):
+        stat = os.stat(image_path)  # Lấy trước khi giải mã: ảnh gốc đổi giữa chừng thì lần sau vẫn thấy cũ
+        pil_img = decode_thumbnail(image_path, size)
+        os.makedirs(os.path.dirname(cover_path), exist_ok=True)
+        tmp_path = f"{cover_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pil_img.convert("RGB").save(tmp_path, format="JPEG", quality=THUMBNAIL_QUALITY)
+        os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp_path, cover_path)
+    with open(cover_path, "rb") as f:
+        data = f.read()
+    return pil_to_buffer(PILImage.open(io.BytesIO(data))), data
+
+def pil_to_buffer(pil_image):
+    # Lấy điểm ảnh thô RGB/RGBA để tải thẳng lên texture (chạy được ở luồng nền)
+    if pil_image.mode not in ("RGB", "RGBA"):
+        has_alpha = pil_image.mode in ("LA", "PA") or (pil_image.mode == "P" and "transparency" in pil_image.info)
+        pil_image = pil_image.convert("RGBA" if has_alpha else "RGB")
+    return PixelBuffer(pil_image.size, pil_image.mode.lower(), pil_image.tobytes())
+
+def decode_image(image_path, size, cache_folder):
+    # (điểm ảnh để tải lên GPU, bytes thumbnail nén để giữ trong cache RAM)
+    data = thumbnail_data(image_path, size, cache_folder)
+    return pil_to_buffer(PILImage.open(io.BytesIO(data))), data
+
+def decode_full_image(image_path, max_size):
+    # Ảnh gốc cho chế độ xem phóng to, chỉ thu nhỏ khi lớn hơn max_size (cỡ màn hình); không ghi cache đĩa
+    pil_img = PILImage.open(image_path)
+    if pil_img.format == "JPEG":
+        pil_img.draft("RGB", (max_size, max_size))
+    pil_img = correct_image_orientation(pil_img)
+    if max(pil_img.size) > max_size:
+        pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+    return pil_to_buffer(pil_img), None
+
+# ===== DECODE POOL =====
+# Giải mã JPEG, xoay EXIF và LANCZOS chạy trong các tiến trình con để dùng hết số nhân CPU.
+# Điểm ảnh trả về qua shared memory (không pickle mảng lớn); chỉ tên vùng nhớ đi qua pipe.
+def _decode_batch_to_shared_memory(decode, image_paths, args):
+    from multiprocessing import shared_memory
+    results = []
+    for image_path in image_paths:
+        try:
+            buffer, data = decode(image_path, *args)
+        except Exception as e:
+            results.append((None, None, None, 0, None, f"{image_path}: {e}"))
+            continue
+        nbytes = len(buffer.data)
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        try:
+            shm.buf[:nbytes] = buffer.data
+        finally:
+            shm.close()
+        results.append((shm.name, buffer.size, buffer.colorfmt, nbytes, data, None))
+    return results
+
+def _read_shared_memory(name, nbytes):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:nbytes])
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _process_context():
+    # Chỉ dùng fork: với spawn/forkserver tiến trình con sẽ chạy lại main.py và mở thêm cửa sổ Kivy.
+    # macOS (fork không an toàn với Cocoa), Windows và Android (không có sem_open) dùng luồng.
+    if sys.platform == "darwin" or hasattr(sys, "getandroidapilevel") or "ANDROID_ARGUMENT" in os.environ:
+        return None
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+
+def _settle(future, source=None, result=None, error=None):
+    # Chuyển kết quả vào Future bên ngoài; bỏ qua nếu nơi gọi đã huỷ nó
+    if source is not None:
+        error = source.exception()
+        result = None if error else source.result()
+    if not future.set_running_or_notify_cancel():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class DecodePool:
+    def __init__(self, cache_folder, workers=DECODE_WORKERS, batch_size=DECODE_BATCH):
+        self.cache_folder = cache_folder
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.executor = None
+        self.uses_processes = False
+
+    def start(self):
+        # Gọi sớm (trước khi có nhiều luồng) để các tiến trình con được fork từ trạng thái gọn nhẹ
+        with self.lock:
+            if self.executor is None:
+                self.executor, self.uses_processes = self._create_executor()
+        return self
+
+    def _create_executor(self):
+        context = _process_context()
+        if context is not None and self.workers > 1:
+            try:
+                from multiprocessing import resource_tracker, shared_memory  # noqa: F401
+                resource_tracker.ensure_running()  # Tiến trình con dùng chung tracker để unlink cân bằng
+                executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                executor.submit(os.getpid).result(timeout=30)  # Tạo đủ tiến trình ngay bây giờ
+                logging.info(f"Decode pool: {self.workers} processes")
+                return executor, True
+            except Exception as e:
+                logging.warning(f"Process pool unavailable, decoding in threads: {e}")
+        return ThreadPoolExecutor(max_workers=self.workers), False
+
+    def decode(self, image_path, size):
+        return self.decode_many([image_path], size)[0]
+
+    def decode_many(self, image_paths, size):
+        # Trả về một Future cho mỗi ảnh, kết quả là (PixelBuffer, bytes nén)
+        return self._submit(decode_image, image_paths, (size, self.cache_folder), self.batch_size)
+
+    def decode_full(self, image_path, max_size):
+        # Future của (PixelBuffer, None): ảnh gốc, thu nhỏ về tối đa max_size
+        return self._submit(decode_full_image, [image_path], (max_size,), 1)[0]
+
+    def build_covers(self, items, size):
+        # items: (ảnh xem trước, đường dẫn ảnh bìa); một Future cho mỗi mục như decode_many
+        return self._submit(make_cover, items, (size,), self.batch_size)
+
+    def _submit(self, decode, image_paths, args, batch_size):
+        self.start()
+        futures = [Future() for _ in image_paths]
+        for start in range(0, len(image_paths), batch_size):
+            batch = image_paths[start:start + batch_size]
+            self._submit_batch(decode, batch, args, futures[start:start + batch_size])
+        return futures
+
+    def _submit_batch(self, decode, batch, args, futures):
+        if self.uses_processes:
+            try:
+                inner = self.executor.submit(_decode_batch_to_shared_memory, decode, batch, args)
+                inner.add_done_callback(lambda f: self._collect(f, decode, batch, args, futures))
+                return
+            except Exception as e:  # Pool hỏng (tiến trình con chết): chuyển hẳn sang luồng
+                self._fall_back_to_threads(e)
+        for image_path, future in zip(batch, futures):
+            inner = self.executor.submit(decode, image_path, *args)
+            inner.add_done_callback(lambda f, out=future: _settle(out, f))
+
+    def _collect(self, inner, decode, batch, args, futures):
+        try:
+            results = inner.result()
+        except BrokenProcessPool as e:
+            self._fall_back_to_threads(e)
+            self._submit_batch(decode, batch, args, futures)
+            return
+        except Exception as e:
+            for future in futures:
+                _settle(future, error=e)
+            return
+        for future, (name, buffer_size, colorfmt, nbytes, data, error) in zip(futures, results):
+            if error is not None:
+                _settle(future, error=ValueError(error))
+                continue
+            try:
+                buffer = PixelBuffer(buffer_size, colorfmt, _read_shared_memory(name, nbytes))
+            except Exception as e:
+                _settle(future, error=e)
+                continue
+            _settle(future, result=(buffer, data))
+
+    def _fall_back_to_threads(self, error):
+        with self.lock:
+            if self.uses_processes:
+                logging.warning(f"Decode process pool failed, switching to threads: {error}")
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+                self.uses_processes = False
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
@@ -1,32 +1,39 @@
+import time
+STARTUP_BEGIN = time.perf_counter()  # Mốc đo thời gian khởi động, đặt trước mọi import nặng
+
 import os
 import io
-import time
 import threading
-import sqlite3
-import requests
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
 
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.clock import Clock
 from kivy.core.window import Window
-from kivy.metrics import dp, sp
+from kivy.metrics import dp
 from kivy.uix.image import Image as KivyImage
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.scrollview import ScrollView
 from kivy.uix.popup import Popup
-from kivy.uix.progressbar import ProgressBar
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.behaviors import ButtonBehavior
-
-from PIL import Image as PILImage
-from PIL.ExifTags import TAGS
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.properties import ObjectProperty
+
+from imaging import DecodePool, cover_is_fresh, pil_to_buffer
+from downloader import (
+    DETECTION_THRESHOLD, IMAGES_PER_PAGE, MAX_THREADS, METERED_CHECK_INTERVAL, THUMBNAIL_CACHE_FOLDER,
+    PRIORITY_VIEW, PRIORITY_PREFETCH, PRIORITY_PAGE, PRIORITY_BULK,
+    db, init_db, update_actor_config, get_cached_page_count, actor_index, log_transport_stats, missing_cache,
+    JobControl, download_jobs, validate_actor_input, process_actor_input, image_url, image_path, cover_path,
+    concurrency, bandwidth, download_engine, discover_pages, download_pages,
+)
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -35,119 +42,396 @@ class IconButton(ButtonBehavior, Label):
     pass
 
 # ===== GLOBALS & CONFIG =====
-PARENT_FOLDER = "Picture AV"
-THUMBNAIL_FOLDER = os.path.join(PARENT_FOLDER, "thumbnail")
-DB_FILE = os.path.join(PARENT_FOLDER, "actors.db")
-
-DETECTION_THRESHOLD = 5 * 1024
-DOWNLOAD_THRESHOLD = 5 * 1024
-MAX_THREADS = 4  # Giới hạn số luồng tải đồng thời
-
-pause_event = threading.Event()
-cancel_event = threading.Event()
-
-all_images = {}  # all_images[page] = list of (file_path, texture) tuples
-
-# ===== DB =====
-def init_db():
-    os.makedirs(PARENT_FOLDER, exist_ok=True)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS actors
-                 (name TEXT PRIMARY KEY, folder_path TEXT, thumbnail_path TEXT)''')
-    conn.commit()
-    conn.close()
-
-def update_actor_config(actor_name, folder_path, thumbnail_path):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO actors (name, folder_path, thumbnail_path) VALUES (?, ?, ?)",
-              (actor_name, folder_path, thumbnail_path))
-    conn.commit()
-    conn.close()
-
-def get_actor_history():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT name, folder_path, thumbnail_path FROM actors")
-    actors = [{"name": row[0], "folder_path": row[1], "thumbnail_path": row[2]} for row in c.fetchall()]
-    conn.close()
-    return actors
+GALLERY_THUMB_SIZE = 300  # Cạnh dài ảnh xem trước trong danh sách trang
+PAGE_THUMB_SIZE = 400  # Cạnh dài ảnh trong màn hình xem trang
+COVER_SIZE = 160  # Cạnh dài ảnh bìa diễn viên trong màn hình lịch sử
+HOT_CACHE_BYTES = 64 * 1024 * 1024  # Ngân sách texture GPU (ước tính rộng x cao x 4)
+WARM_CACHE_BYTES = 16 * 1024 * 1024  # Ngân sách thumbnail nén giữ trong RAM
+MAX_CACHED_PAGES = 256  # Số trang nhớ danh sách ảnh
+ENLARGED_NEIGHBOURS = 1  # Số ảnh mỗi bên ảnh đang phóng to được giải mã sẵn ở độ phân giải đầy đủ
+PLACEHOLDER_COLOR = (1, 1, 1, 0.08)  # Ô chờ mờ trong lúc ảnh đang tải
+HISTORY_SEARCH_DELAY = 0.15  # Giây chờ sau lần gõ cuối trước khi tìm trong lịch sử
+UI_FRAME_BUDGET = 0.008  # Thời gian (giây) tối đa mỗi khung hình dành cho việc cập nhật UI từ luồng nền
+GALLERY_OVERSCAN_ROWS = 2  # Số hàng ngoài màn hình (mỗi phía) được tải thumbnail sẵn
+PREFETCH_DEPTH = 1  # Số trang làm ấm trước mỗi phía trang đang xem
+PREFETCH_SLIDESHOW_DEPTH = 3  # Khi trình chiếu: số trang phía trước được làm ấm
+PREFETCH_BUDGET_BYTES = 24 * 1024 * 1024  # Texture tối đa một lượt làm ấm đưa lên GPU, phần còn lại chỉ giữ bytes nén
 
 # ===== UTILS =====
-def validate_actor_input(actor_input):
-    if not actor_input or len(actor_input.strip()) < 3 or not actor_input.replace(" ", "").isalnum():
-        return False, "Tên diễn viên phải dài ít nhất 3 ký tự và chỉ chứa chữ/số!"
-    return True, ""
-
-def process_actor_input(actor_input):
-    slug = actor_input.lower().replace(" ", "-")
-    tokens = slug.split('-')
-    if len(tokens) == 4:
-        sub_name = f"{tokens[0].title()} {tokens[1].title()} & {tokens[2].title()} {tokens[3].title()}"
-    else:
-        sub_name = slug.replace('-', ' ').title()
-    folder_name = os.path.join(PARENT_FOLDER, sub_name)
-    return slug, folder_name, sub_name
-
-def fetch_image(url, timeout=10):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, stream=True, timeout=timeout)
-        response.raise_for_status()
-        if "404.Not.Found.svg" not in response.url:
-            return response.content
-        return None
-    except requests.RequestException as e:
-        logging.error(f"Error fetching {url}: {e}")
-        return None
-
-def download_image(url, save_path):
-    try:
-        image_data = fetch_image(url)
-        if image_data and len(image_data) >= DOWNLOAD_THRESHOLD:
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            with open(save_path, "wb") as f:
-                f.write(image_data)
-            return None
-        return f"{os.path.basename(save_path)} (không đủ kích thước)"
-    except Exception as e:
-        logging.error(f"Error downloading {url}: {e}")
-        return f"{os.path.basename(save_path)} ({str(e)})"
-
-def correct_image_orientation(pil_image):
-    try:
-        exif = pil_image._getexif()
-        if exif is not None:
-            for tag, value in exif.items():
-                if TAGS.get(tag) == 'Orientation':
-                    if value == 3:
-                        pil_image = pil_image.rotate(180, expand=True)
-                    elif value == 6:
-                        pil_image = pil_image.rotate(270, expand=True)
-                    elif value == 8:
-                        pil_image = pil_image.rotate(90, expand=True)
-                    break
-    except Exception as e:
-        logging.warning(f"Error reading EXIF data: {e}")
-    return pil_image
+def buffer_to_texture(buffer):
+    # Phải chạy trên luồng Kivy (cần OpenGL context)
+    from kivy.graphics.texture import Texture
+    texture = Texture.create(size=buffer.size, colorfmt=buffer.colorfmt)
+    texture.blit_buffer(buffer.data, colorfmt=buffer.colorfmt, bufferfmt="ubyte")
+    texture.flip_vertical()  # PIL lưu từ trên xuống, OpenGL từ dưới lên: chỉ đảo toạ độ, không chép dữ liệu
+    return texture
 
 def pil_to_texture(pil_image):
-    from kivy.core.image import Image as CoreImage
-    data = io.BytesIO()
-    pil_image.save(data, format="png")
-    data.seek(0)
-    core_image = CoreImage(data, ext="png")
-    texture = core_image.texture
-    return texture
+    return buffer_to_texture(pil_to_buffer(pil_image))
+
+# ===== STARTUP TIMING =====
+# Mỗi giai đoạn khởi động được đánh dấu một mốc; khi khung hình đầu tiên lên màn hình thì in một dòng
+# "Startup: imports ..ms, build ..ms, first frame ..ms, total ..ms" (tính từ dòng đầu main.py).
+class StartupTimer:
+    def __init__(self, began):
+        self.began = began
+        self.marks = []  # (giai đoạn, thời điểm perf_counter)
+
+    def mark(self, stage):
+        self.marks.append((stage, time.perf_counter()))
+
+    def report(self):
+        stages = {}
+        last = self.began
+        for stage, at in self.marks:
+            stages[stage] = (at - last) * 1000
+            last = at
+        stages["total"] = (last - self.began) * 1000
+        return stages
+
+    def log(self):
+        logging.info("Startup: " + ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in self.report().items()))
+
+startup_timer = StartupTimer(STARTUP_BEGIN)
+
+# ===== UI DISPATCHER =====
+# Luồng nền gửi cập nhật UI vào đây thay vì gọi Clock.schedule_once cho từng việc:
+# - post(): việc xếp hàng, mỗi khung hình chỉ chạy trong UI_FRAME_BUDGET, phần còn lại để khung sau
+# - post_latest(): chỉ giữ giá trị mới nhất theo khoá (vd. phần trăm tiến độ)
+class UIDispatcher:
+    def __init__(self, budget=UI_FRAME_BUDGET):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.tasks = deque()
+        self.latest = OrderedDict()  # khoá -> (hàm, tham số)
+        self.scheduled = False
+
+    def post(self, fn, *args):
+        with self.lock:
+            self.tasks.append((fn, args))
+            self._wake()
+
+    def post_latest(self, key, fn, *args):
+        with self.lock:
+            self.latest[key] = (fn, args)
+            self._wake()
+
+    def _wake(self):
+        if not self.scheduled:
+            self.scheduled = True
+            Clock.schedule_once(self._run)
+
+    def _run(self, dt):
+        deadline = time.perf_counter() + self.budget
+        with self.lock:
+            latest, self.latest = self.latest, OrderedDict()
+        for fn, args in latest.values():
+            self._call(fn, args)
+        while time.perf_counter() < deadline:
+            with self.lock:
+                if not self.tasks:
+                    break
+                fn, args = self.tasks.popleft()
+            self._call(fn, args)
+        with self.lock:
+            self.scheduled = False
+            if self.tasks or self.latest:
+                self._wake()
+
+    @staticmethod
+    def _call(fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.exception(f"UI update failed: {e}")
+
+ui_dispatcher = UIDispatcher()
+
+# ===== IMAGE CACHE =====
+# Hai tầng, khoá (diễn viên, trang, ảnh), LRU theo dung lượng:
+# - hot: texture GPU đang dùng (chỉ truy cập từ luồng Kivy)
+# - warm: bytes thumbnail nén, giải nén và tải lại lên GPU rất rẻ
+class ImageCache:
+    def __init__(self, hot_budget=HOT_CACHE_BYTES, warm_budget=WARM_CACHE_BYTES, max_pages=MAX_CACHED_PAGES):
+        self.hot_budget = hot_budget
+        self.warm_budget = warm_budget
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self.hot = OrderedDict()  # key -> texture
+        self.hot_bytes = 0
+        self.warm = OrderedDict()  # key -> bytes
+        self.warm_bytes = 0
+        self.pages = OrderedDict()  # (actor, page) -> danh sách đường dẫn ảnh
+        self.counters = {"hot_hits": 0, "warm_hits": 0, "misses": 0, "hot_evictions": 0, "warm_evictions": 0}
+
+    @staticmethod
+    def texture_bytes(texture):
+        width, height = texture.size
+        return width * height * 4
+
+    def get_texture(self, key):
+        with self.lock:
+            texture = self.hot.get(key)
+            if texture is not None:
+                self.hot.move_to_end(key)
+                self.counters["hot_hits"] += 1
+                return texture
+            data = self.warm.get(key)
+            if data is None:
+                self.counters["misses"] += 1
+                return None
+            self.warm.move_to_end(key)
+            self.counters["warm_hits"] += 1
+        from PIL import Image as PILImage
+        texture = pil_to_texture(PILImage.open(io.BytesIO(data)))
+        self.put(key, texture)
+        return texture
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.hot or key in self.warm
+
+    def put_data(self, key, data):
+        # Chỉ tầng warm: gọi được từ luồng nền
+        with self.lock:
+            self._put_warm(key, data)
+
+    def _put_warm(self, key, data):
+        old = self.warm.pop(key, None)
+        if old is not None:
+            self.warm_bytes -= len(old)
+        self.warm[key] = data
+        self.warm_bytes += len(data)
+        while self.warm_bytes > self.warm_budget and len(self.warm) > 1:
+            _, evicted = self.warm.popitem(last=False)
+            self.warm_bytes -= len(evicted)
+            self.counters["warm_evictions"] += 1
+
+    def discard(self, key):
+        with self.lock:
+            texture = self.hot.pop(key, None)
+            if texture is not None:
+                self.hot_bytes -= self.texture_bytes(texture)
+            data = self.warm.pop(key, None)
+            if data is not None:
+                self.warm_bytes -= len(data)
+
+    def put(self, key, texture, data=None):
+        with self.lock:
+            if data is not None:
+                self._put_warm(key, data)
+            old = self.hot.pop(key, None)
+            if old is not None:
+                self.hot_bytes -= self.texture_bytes(old)
+            self.hot[key] = texture
+            self.hot_bytes += self.texture_bytes(texture)
+            while self.hot_bytes > self.hot_budget and len(self.hot) > 1:
+                _, evicted = self.hot.popitem(last=False)  # Vẫn còn ở tầng warm nếu chưa bị đẩy ra
+                self.hot_bytes -= self.texture_bytes(evicted)
+                self.counters["hot_evictions"] += 1
+
+    def get_page(self, actor, page):
+        with self.lock:
+            paths = self.pages.get((actor, page))
+            if paths is not None:
+                self.pages.move_to_end((actor, page))
+            return paths
+
+    def set_page(self, actor, page, paths):
+        with self.lock:
+            self.pages[(actor, page)] = list(paths)
+            self.pages.move_to_end((actor, page))
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hot_hits"] + self.counters["warm_hits"] + self.counters["misses"]
+            return dict(self.counters,
+                        hot_items=len(self.hot), hot_bytes=self.hot_bytes,
+                        warm_items=len(self.warm), warm_bytes=self.warm_bytes,
+                        hit_ratio=(lookups - self.counters["misses"]) / lookups if lookups else 0.0)
+
+image_cache = ImageCache()
+decode_pool = DecodePool(THUMBNAIL_CACHE_FOLDER)
+
+class PageLoad:
+    # Một lần tải ảnh của một trang ở nền. Ảnh có sẵn được giải mã trước, ảnh thiếu được gửi
+    # vào download_engine (trừ khi download=False); mỗi ảnh xong là báo ngay qua callback.
+    # cancel() bỏ các ảnh chưa tải; có thể gọi từ luồng UI trước hoặc trong lúc run() đang gửi ảnh.
+    def __init__(self, actor, page, folder_name, slug, priority=PRIORITY_VIEW, download=True):
+        self.actor = actor
+        self.page = page
+        self.folder_name = folder_name
+        self.slug = slug
+        self.priority = priority
+        self.download = download
+        self.lock = threading.Lock()  # Giữ cancelled, save_paths, released
+        self.cancelled = False
+        self.save_paths = []
+        self.released = 0  # Số ảnh đầu của save_paths đã trả lại download_engine
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+        self.release_submitted()
+
+    def release_submitted(self):
+        # Trả lại các ảnh đã gửi mà chưa trả; gọi cả sau vòng gửi, vì ảnh gửi ngay lúc cancel()
+        # đang chạy sẽ lọt khỏi lần trả của cancel()
+        with self.lock:
+            if not self.cancelled:
+                return
+            save_paths, self.released = self.save_paths[self.released:], len(self.save_paths)
+        download_engine.release(save_paths, self.priority)
+
+    def run(self, on_image, on_missing, skip=()):
+        found = []
+        pending = {}
+        complete = True  # False nếu bỏ qua ảnh chưa tải: danh sách ảnh của trang chưa chắc đủ
+        for img_num in range(1, IMAGES_PER_PAGE + 1):
+            path = image_path(self.folder_name, self.page, img_num)
+            if os.path.exists(path):
+                found.append((img_num, path))
+                continue
+            url = image_url(self.slug, self.page, img_num)
+            if missing_cache.is_missing(url):
+                on_missing(img_num)
+                continue
+            if not self.download:
+                complete = False
+                continue
+            if self.cancelled:
+                break
+            future = download_engine.submit(url, path, self.priority, record=(self.actor, self.page, img_num))
+            with self.lock:
+                self.save_paths.append(path)  # Chỉ ghi sau khi đã gửi, để cancel() không trả ảnh chưa gửi
+            pending[future] = (img_num, path)
+        self.release_submitted()
+        if self.cancelled:
+            return False
+        # Ảnh có sẵn giải mã cả loạt trên DecodePool; ảnh tải xong được giải mã ngay khi về
+        ready = [(img_num, path) for img_num, path in found if img_num not in skip]
+        decoding = dict(zip(decode_pool.decode_many([path for _, path in ready], PAGE_THUMB_SIZE), ready))
+        while (pending or decoding) and not self.cancelled:
+            done, _ = wait(list(pending) + list(decoding), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in pending:
+                    img_num, path = pending.pop(future)
+                    if not future.cancelled() and future.exception() is None and future.result() is None:
+                        found.append((img_num, path))
+                        decoding[decode_pool.decode(path, PAGE_THUMB_SIZE)] = (img_num, path)
+                        continue
+                    on_missing(img_num)
+                    if not missing_cache.is_missing(image_url(self.slug, self.page, img_num)):
+                        complete = False  # Lỗi mạng/bị huỷ, không phải ảnh không tồn tại: lần sau tải lại trang
+                    continue
+                img_num, path = decoding.pop(future)
+                try:
+                    buffer, data = future.result()
+                except Exception as e:
+                    logging.error(f"Error decoding image {path}: {e}")
+                    on_missing(img_num)
+                    continue
+                on_image(img_num, path, buffer, data)
+        if self.cancelled:
+            for future in decoding:
+                future.cancel()
+            return False
+        if complete:
+            image_cache.set_page(self.actor, self.page, [path for _, path in sorted(found)])
+        return True
+
+# ===== PREFETCH =====
+# Làm ấm các trang kề trang đang xem vào image_cache để lật trang không phải chờ mạng/giải mã.
+class Prefetcher:
+    # Mọi phương thức chạy trên luồng Kivy; PageLoad chạy ở luồng nền, lần lượt từ trang gần nhất.
+    def __init__(self, depth=PREFETCH_DEPTH, slideshow_depth=PREFETCH_SLIDESHOW_DEPTH, budget=PREFETCH_BUDGET_BYTES):
+        self.depth = depth
+        self.slideshow_depth = slideshow_depth
+        self.budget = budget
+        self.loads = {}  # (diễn viên, trang) -> PageLoad đang làm ấm
+        self.uploaded = 0  # Số byte texture lượt hiện tại đã đưa lên GPU
+
+    def target_pages(self, page, total_pages, slideshow, profile):
+        ahead, behind = (self.slideshow_depth, 0) if slideshow else (self.depth, self.depth)
+        if profile.prefetch_depth is not None:  # Mạng tính phí: chỉ trang kế tiếp
+            ahead, behind = min(ahead, profile.prefetch_depth), 0
+        pages = []
+        for distance in range(1, max(ahead, behind) + 1):
+            if distance <= ahead and page + distance <= total_pages:
+                pages.append(page + distance)
+            if distance <= behind and page - distance >= 1:
+                pages.append(page - distance)
+        return pages
+
+    def schedule(self, actor, folder_name, slug, page, total_pages, slideshow=False):
+        profile = bandwidth.refresh()
+        wanted = [(actor, p) for p in self.target_pages(page, total_pages, slideshow, profile)]
+        for key in list(self.loads):
+            if key not in wanted:
+                self.loads.pop(key).cancel()
+        self.uploaded = 0
+        loads = []
+        for key in wanted:
+            if key in self.loads or self.is_warm(key):
+                continue
+            load = PageLoad(actor, key[1], folder_name, slug, PRIORITY_PREFETCH, download=profile.prefetch_download)
+            self.loads[key] = load
+            loads.append(load)
+        if loads:
+            threading.Thread(target=self.run_loads, args=(loads,), daemon=True).start()
+
+    @staticmethod
+    def is_warm(key):
+        paths = image_cache.get_page(*key)
+        return paths is not None and all(image_cache.contains(key + (path,)) for path in paths)
+
+    def run_loads(self, loads):
+        for load in loads:
+            if load.cancelled:
+                continue
+            skip = {n for n in range(1, IMAGES_PER_PAGE + 1)
+                    if image_cache.contains((load.actor, load.page, image_path(load.folder_name, load.page, n)))}
+            load.run(on_image=lambda n, path, buffer, data, load=load: ui_dispatcher.post(
+                         self.store, load, path, buffer, data),
+                     on_missing=lambda n: None,
+                     skip=skip)
+            ui_dispatcher.post(self.finish, load)
+
+    def store(self, load, path, buffer, data):
+        key = (load.actor, load.page, path)
+        if load.cancelled or image_cache.contains(key):
+            return
+        width, height = buffer.size
+        if self.uploaded + width * height * 4 <= self.budget:
+            self.uploaded += width * height * 4
+            image_cache.put(key, buffer_to_texture(buffer), data)
+        else:
+            image_cache.put_data(key, data)
+
+    def finish(self, load):
+        key = (load.actor, load.page)
+        if self.loads.get(key) is load:
+            del self.loads[key]
+
+    def hold(self, actor, page):
+        # Trang này sắp được PageLoad chính tải: bỏ lượt làm ấm của nó, giữ các trang khác
+        load = self.loads.pop((actor, page), None)
+        if load is not None:
+            load.cancel()
+
+    def cancel_all(self):
+        for load in self.loads.values():
+            load.cancel()
+        self.loads.clear()
+
+prefetcher = Prefetcher()
 
 # ===== KIVY KV STRING =====
 KV = '''
-ScreenManager:
+LazyScreenManager:
     MainScreen:
-    HistoryScreen:
-    FullImageScreen:
-    DownloadScreen:
 
 <MainScreen>:
     name: "main"
@@ -173,27 +457,26 @@ ScreenManager:
             Button:
                 text: "Tìm Kiếm"
                 on_release: root.load_gallery()
-        ScrollView:
-            size_hint: (1,1)
+        ThumbnailGrid:
+            id: gallery_view
+            owner: root
+            viewclass: "ThumbnailTile"
             do_scroll_x: False
             do_scroll_y: True
-            BoxLayout:
-                orientation: "vertical"
+            RecycleGridLayout:
+                cols: 2
+                spacing: dp(5)
+                padding: dp(5)
+                default_size: None, dp(350)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
-                GridLayout:
-                    id: gallery_grid
-                    cols: 2
-                    spacing: dp(5)
-                    padding: dp(5)
-                    size_hint_y: None
-                    height: self.minimum_height
-                Label:
-                    id: empty_label
-                    text: "Không có ảnh nào để hiển thị"
-                    size_hint_y: None
-                    height: dp(50) if self.text else 0
-                    opacity: 1 if self.text else 0
+        Label:
+            id: empty_label
+            text: ""
+            size_hint_y: None
+            height: dp(50) if self.text else 0
+            opacity: 1 if self.text else 0
         Label:
             id: status_label
             text: "Số trang phát hiện: 0"
@@ -246,13 +529,18 @@ ScreenManager:
             size_hint_y: None
             height: dp(40)
             on_text: root.filter_history(self.text)
-        ScrollView:
-            size_hint: (1,1)
-            GridLayout:
-                id: actor_history
-                cols: 1
+        ThumbnailGrid:
+            id: actor_history
+            owner: root
+            viewclass: "ThumbnailTile"
+            do_scroll_x: False
+            do_scroll_y: True
+            RecycleGridLayout:
+                cols: 3
                 spacing: dp(5)
                 padding: dp(5)
+                default_size: None, dp(220)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
         Button:
@@ -296,15 +584,18 @@ ScreenManager:
             size_hint_y: None
             height: dp(30)
             halign: 'center'
-        ScrollView:
-            size_hint: (1,1)
+        ThumbnailGrid:
+            id: page_images_view
+            owner: root
+            viewclass: "ThumbnailTile"
             do_scroll_x: False
             do_scroll_y: True
-            GridLayout:
-                id: page_images_grid
+            RecycleGridLayout:
                 cols: 2
                 spacing: dp(5)
                 padding: dp(5)
+                default_size: None, dp(400)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
 
@@ -347,6 +638,19 @@ ScreenManager:
             size_hint_y: None
             height: dp(30)
 
+<ThumbnailTile>:
+    orientation: "vertical"
+    Image:
+        id: image
+        fit_mode: "contain"
+    Label:
+        id: label
+        text: ""
+        size_hint_y: None
+        height: dp(50) if self.text else 0
+        opacity: 1 if self.text else 0
+        halign: 'center'
+
 <IconButton@ButtonBehavior+Label>:
     text: ''
     size_hint: None, None
@@ -356,12 +660,48 @@ ScreenManager:
     valign: 'middle'
 '''
 
+# ===== LƯỚI THUMBNAIL =====
+# RecycleView chỉ dựng widget cho các ô đang thấy; ô cuộn ra ngoài được dùng lại cho dữ liệu mới.
+# Mỗi ô hỏi màn hình chủ (owner) texture theo "key" (số trang hoặc số ảnh) và báo lại khi bị chạm.
+class ThumbnailGrid(RecycleView):
+    owner = ObjectProperty(None, allownone=True)
+
+class ThumbnailTile(RecycleDataViewBehavior, BoxLayout):
+    key = None
+    owner = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.owner = rv.owner
+        self.key = data["key"]
+        self.ids.label.text = data.get("text", "")
+        self.show(self.owner.tile_texture(self.key))
+        return super().refresh_view_attrs(rv, index, data)
+
+    def show(self, texture):
+        self.ids.image.texture = texture
+        self.ids.image.color = (1, 1, 1, 1) if texture is not None else PLACEHOLDER_COLOR
+
+    def on_touch_down(self, touch):
+        if self.owner is not None and self.owner.on_image_touch(self.ids.image, touch, self.key):
+            return True
+        return super().on_touch_down(touch)
+
+def visible_tiles(grid):
+    return [tile for tile in grid.layout_manager.children if tile.key is not None]
+
 # ===== MÀN HÌNH CHÍNH =====
+PREVIEW_MISSING = object()  # fetch_preview: trang không có ảnh xem trước; None = lỗi tạm thời, lần sau hỏi lại
+
 class MainScreen(Screen):
     total_pages_detected = 0
+    gallery = None  # (slug, thư mục, tên) của lần tìm kiếm đang hiển thị
+    thumb_executor = None
+    thumb_requests = {}  # trang -> Future thumbnail đang chờ
+    gallery_missing = set()  # Trang không có ảnh xem trước, không hỏi lại
 
-    def on_pre_enter(self):
-        init_db()
+    def on_kv_post(self, base_widget):
+        self.update_overscan_trigger = Clock.create_trigger(self.update_overscan)
+        bandwidth.add_listener(lambda profile: ui_dispatcher.post(self.on_bandwidth_profile, profile))
 
     def load_gallery(self):
         actor_input = self.ids.actor_input.text.strip()
@@ -371,82 +711,133 @@ class MainScreen(Screen):
             return
         slug, folder_name, sub_name = process_actor_input(actor_input)
         self.ids.status_label.text = "Đang tải..."
-        self.ids.gallery_grid.clear_widgets()
+        self.cancel_thumbnails()
+        self.ids.gallery_view.data = []
         self.ids.empty_label.text = ""  # Reset thông báo trống
         self.total_pages_detected = 0
-
-        base_url = f"https://jjgirls.com/japanese/{slug}"
-
-        def fetch_page(page):
-            local_preview_path = os.path.join(folder_name, f"{os.path.basename(folder_name)}-{page}-1.jpg")
-            if os.path.exists(local_preview_path):
-                return local_preview_path
-            preview_url = f"{base_url}/{page}/{slug}-1.jpg"
-            image_data = fetch_image(preview_url)
-            if image_data and len(image_data) >= DETECTION_THRESHOLD:
-                os.makedirs(folder_name, exist_ok=True)
-                try:
-                    with open(local_preview_path, "wb") as f:
-                        f.write(image_data)
-                    return local_preview_path
-                except Exception as e:
-                    logging.error(f"Error saving image {local_preview_path}: {e}")
-                    return None
-            return None
-
-        def add_thumbnail(page, image_path):
-            try:
-                pil_img = PILImage.open(image_path)
-                if pil_img.format not in ["JPEG", "PNG"]:
-                    raise ValueError("Định dạng ảnh không được hỗ trợ")
-                pil_img = correct_image_orientation(pil_img)
-                pil_img.thumbnail((300, 300), PILImage.Resampling.LANCZOS)
-                texture = pil_to_texture(pil_img)
-
-                container = BoxLayout(orientation='vertical', size_hint_y=None, height=dp(350))
-                img_widget = KivyImage(texture=texture, size_hint=(1, None), height=dp(300), fit_mode='contain')
-                img_widget.bind(on_touch_down=lambda instance, touch: self.on_image_touch(instance, touch, page, folder_name, slug, sub_name))
-                label = Label(text=f"Trang {page}", size_hint_y=None, height=dp(50), halign='center')
-                
-                container.add_widget(img_widget)
-                container.add_widget(label)
-                self.ids.gallery_grid.add_widget(container)
-            except Exception as e:
-                logging.error(f"Error processing thumbnail for page {page}: {e}")
-                Clock.schedule_once(lambda dt: self.show_popup("Lỗi", f"Không thể hiển thị ảnh trang {page}: {str(e)}"))
+        gallery = (slug, folder_name, sub_name)  # Bỏ kết quả của lần tìm kiếm trước nếu người dùng tìm diễn viên khác
+        self.gallery = gallery
+        self.thumb_executor = ThreadPoolExecutor(max_workers=MAX_THREADS)
 
         def load_pages():
-            page = 1
-            with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-                while True:
-                    image_path = fetch_page(page)
-                    if image_path:
-                        self.total_pages_detected = page
-                        Clock.schedule_once(lambda dt, p=page, path=image_path: add_thumbnail(p, path))
-                        page += 1
-                    else:
-                        break
-            Clock.schedule_once(lambda dt: self.update_status())
-            if self.total_pages_detected > 0:
-                preview_path = os.path.join(folder_name, f"{os.path.basename(folder_name)}-1-1.jpg")
-                if os.path.exists(preview_path):
-                    update_actor_config(sub_name, folder_name,
-                        os.path.join(THUMBNAIL_FOLDER, f"{sub_name.lower().replace(' ', '-')}-thumb.jpg"))
+            from requests import RequestException
+            try:
+                page_count = discover_pages(slug, folder_name, sub_name)
+            except RequestException as e:
+                # Giữ số trang đã lưu (nếu có) thay vì ghi đè bằng kết quả dò bị cắt ngắn
+                logging.error(f"Error discovering pages for {sub_name}: {e}")
+                page_count, _ = get_cached_page_count(sub_name)
+                ui_dispatcher.post(self.show_gallery, gallery, page_count or 0, "Lỗi mạng, không dò được số trang")
+                return
+            ui_dispatcher.post(self.show_gallery, gallery, page_count)
+            log_transport_stats()
 
         threading.Thread(target=load_pages, daemon=True).start()
 
-    def on_image_touch(self, instance, touch, page, folder_name, slug, sub_name):
+    def show_gallery(self, gallery, page_count, error=None):
+        # Chỉ đặt dữ liệu; thumbnail được tải khi ô của trang đó (hoặc hàng lân cận) hiện ra
+        if self.gallery is not gallery:
+            return
+        self.total_pages_detected = page_count
+        self.ids.gallery_view.data = [{"key": page, "text": f"Trang {page}"} for page in range(1, page_count + 1)]
+        self.update_status()
+        if error:
+            self.ids.status_label.text = error
+
+    def gallery_key(self, page):
+        _, folder_name, sub_name = self.gallery
+        return (sub_name, page, image_path(folder_name, page, 1), GALLERY_THUMB_SIZE)
+
+    def tile_texture(self, page):
+        texture = image_cache.get_texture(self.gallery_key(page))
+        if texture is None:
+            self.request_thumbnail(page)
+        self.update_overscan_trigger()
+        return texture
+
+    def update_overscan(self, *args):
+        # Tải sẵn vài hàng quanh vùng đang thấy, huỷ các yêu cầu chưa chạy đã ra khỏi vùng đó
+        pages = [tile.key for tile in visible_tiles(self.ids.gallery_view)]
+        if not pages:
+            return
+        margin = GALLERY_OVERSCAN_ROWS * self.ids.gallery_view.layout_manager.cols
+        wanted = range(max(1, min(pages) - margin), min(self.total_pages_detected, max(pages) + margin) + 1)
+        for page, future in list(self.thumb_requests.items()):
+            if page not in wanted and future.cancel():
+                del self.thumb_requests[page]
+        for page in wanted:
+            if not image_cache.contains(self.gallery_key(page)):
+                self.request_thumbnail(page)
+
+    def request_thumbnail(self, page):
+        if page in self.thumb_requests or page in self.gallery_missing:
+            return
+        gallery = self.gallery
+        future = self.thumb_executor.submit(self.fetch_preview, gallery, page)
+        self.thumb_requests[page] = future
+        future.add_done_callback(lambda f: ui_dispatcher.post(self.on_thumbnail, gallery, page, f))
+
+    def fetch_preview(self, gallery, page):
+        # Chạy ở luồng nền: tải ảnh đầu của trang nếu chưa có rồi giải mã thumbnail
+        slug, folder_name, sub_name = gallery
+        local_preview_path = image_path(folder_name, page, 1)
+        if not os.path.exists(local_preview_path):
+            url = image_url(slug, page, 1)
+            future = download_engine.submit(url, local_preview_path, PRIORITY_VIEW,
+                                            threshold=DETECTION_THRESHOLD, record=(sub_name, page, 1))
+            try:
+                if future.result() is not None:
+                    return PREVIEW_MISSING if missing_cache.is_missing(url) else None
+            except CancelledError:
+                return None
+        try:
+            result = decode_pool.decode(local_preview_path, GALLERY_THUMB_SIZE).result()
+        except Exception as e:
+            logging.error(f"Error processing thumbnail for page {page}: {e}")
+            ui_dispatcher.post(self.show_popup, "Lỗi", f"Không thể hiển thị ảnh trang {page}: {str(e)}")
+            return PREVIEW_MISSING  # File hỏng: hỏi lại chỉ hiện lại lỗi
+        if page == 1:
+            update_actor_config(sub_name, folder_name, cover_path(sub_name))
+        return result
+
+    def on_thumbnail(self, gallery, page, future):
+        if self.gallery is not gallery or self.thumb_requests.get(page) is not future:
+            return
+        del self.thumb_requests[page]
+        if future.cancelled():
+            return
+        result = future.result()
+        if result is PREVIEW_MISSING:
+            self.gallery_missing.add(page)
+            return
+        if result is None:  # Lỗi mạng: ô giữ chỗ trống, lần bind/overscan sau tải lại
+            return
+        buffer, data = result
+        texture = buffer_to_texture(buffer)
+        image_cache.put(self.gallery_key(page), texture, data)
+        for tile in visible_tiles(self.ids.gallery_view):
+            if tile.key == page:
+                tile.show(texture)
+
+    def cancel_thumbnails(self):
+        if self.thumb_executor is not None:
+            self.thumb_executor.shutdown(wait=False, cancel_futures=True)
+        self.thumb_requests = {}
+        self.gallery_missing = set()
+
+    def on_image_touch(self, instance, touch, page):
         if instance.collide_point(*touch.pos) and touch.button == 'left':
+            slug, folder_name, sub_name = self.gallery
             self.open_full_image(page, folder_name, slug, sub_name)
+            return True
+        return False
 
     def update_status(self):
         self.ids.status_label.text = f"Số trang phát hiện: {self.total_pages_detected}"
-        if self.total_pages_detected > 0 and not self.ids.gallery_grid.children:
+        if self.total_pages_detected == 0:
             self.ids.empty_label.text = "Không có ảnh nào để hiển thị"
 
     def open_full_image(self, page, folder_name, slug, sub_name):
-        if page not in all_images:
-            self.load_page_images(page, folder_name, slug)
         full_screen = self.manager.get_screen("full_image")
         full_screen.current_page = page
         full_screen.folder_name = folder_name
@@ -455,34 +846,6 @@ class MainScreen(Screen):
         full_screen.load_current_page()
         self.manager.current = "full_image"
 
-    def load_page_images(self, page, folder_name, slug):
-        if page in all_images:
-            return
-        base_url = f"https://jjgirls.com/japanese/{slug}"
-        all_images[page] = []
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = []
-            for img_num in range(1, 13):
-                local_img_path = os.path.join(folder_name, f"{os.path.basename(folder_name)}-{page}-{img_num}.jpg")
-                if os.path.exists(local_img_path):
-                    pil_img = PILImage.open(local_img_path)
-                    pil_img = correct_image_orientation(pil_img)
-                    pil_img.thumbnail((400, 400), PILImage.Resampling.LANCZOS)
-                    texture = pil_to_texture(pil_img)
-                    all_images[page].append((local_img_path, texture))
-                else:
-                    img_url = f"{base_url}/{page}/{slug}-{img_num}.jpg"
-                    futures.append(executor.submit(download_image, img_url, local_img_path))
-            for future in futures:
-                result = future.result()
-                if not result:  # No error
-                    local_img_path = os.path.join(folder_name, f"{os.path.basename(folder_name)}-{page}-{len(all_images[page]) + 1}.jpg")
-                    pil_img = PILImage.open(local_img_path)
-                    pil_img = correct_image_orientation(pil_img)
-                    pil_img.thumbnail((400, 400), PILImage.Resampling.LANCZOS)
-                    texture = pil_to_texture(pil_img)
-                    all_images[page].append((local_img_path, texture))
-
     def download_page(self):
         actor_input = self.ids.actor_input.text.strip()
         is_valid, error_msg = validate_actor_input(actor_input)
@@ -490,7 +853,7 @@ class MainScreen(Screen):
             self.show_popup("Lỗi", error_msg)
             return
         slug, folder_name, sub_name = process_actor_input(actor_input)
-        threading.Thread(target=self.download_page_images, args=(1, slug, folder_name, sub_name), daemon=True).start()
+        JobControl(f"{sub_name} trang 1", self.download_page_images, (1, slug, folder_name, sub_name)).start()
 
     def download_all(self):
         actor_input = self.ids.actor_input.text.strip()
@@ -499,7 +862,7 @@ class MainScreen(Screen):
             self.show_popup("Lỗi", error_msg)
             return
         slug, folder_name, sub_name = process_actor_input(actor_input)
-        threading.Thread(target=self.download_all_images, args=(slug, folder_name, sub_name), daemon=True).start()
+        JobControl(f"{sub_name} tất cả", self.download_all_images, (slug, folder_name, sub_name)).start()
 
     def show_range_popup(self):
         content = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
@@ -529,110 +892,61 @@ class MainScreen(Screen):
             self.show_popup("Lỗi", error_msg)
             return
         slug, folder_name, sub_name = process_actor_input(actor_input)
-        threading.Thread(target=self.download_range_images, args=(start, end, slug, folder_name, sub_name), daemon=True).start()
-
-    def download_page_images(self, page, slug, folder_name, sub_name):
-        base_url = f"https://jjgirls.com/japanese/{slug}"
-        errors = []
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = []
-            for img_num in range(1, 13):
-                if cancel_event.is_set():
-                    Clock.schedule_once(lambda dt: self.show_popup("Thông báo", f"Tải trang {page} bị hủy!"))
-                    return
-                while pause_event.is_set() and not cancel_event.is_set():
-                    time.sleep(0.1)
-                img_url = f"{base_url}/{page}/{slug}-{img_num}.jpg"
-                filename = f"{os.path.basename(folder_name)}-{page}-{img_num}.jpg"
-                save_path = os.path.join(folder_name, filename)
-                if os.path.exists(save_path):
-                    continue
-                futures.append(executor.submit(download_image, img_url, save_path))
-            for future in futures:
-                result = future.result()
-                if result:
-                    errors.append(result)
-        if errors:
-            Clock.schedule_once(lambda dt: self.show_popup("Cảnh báo", f"Có lỗi tải: {', '.join(errors)}"))
+        JobControl(f"{sub_name} trang {start}-{end}", self.download_range_images,
+                   (start, end, slug, folder_name, sub_name)).start()
+
+    def download_pages(self, pages, slug, folder_name, sub_name, priority, report_progress=True, job=None):
+        def progress(done, total):
+            ui_dispatcher.post_latest("progress", self.update_progress, done / total * 100)
+        return download_pages(pages, slug, folder_name, sub_name, priority,
+                              progress=progress if report_progress else None, job=job)
+
+    def download_page_images(self, page, slug, folder_name, sub_name, job=None):
+        errors = self.download_pages([page], slug, folder_name, sub_name, PRIORITY_PAGE, report_progress=False, job=job)
+        if errors is None:
+            ui_dispatcher.post(self.show_popup, "Thông báo", f"Tải trang {page} bị hủy!")
+        elif errors:
+            ui_dispatcher.post(self.show_popup, "Cảnh báo", f"Có lỗi tải: {', '.join(errors)}")
         else:
-            Clock.schedule_once(lambda dt: self.show_popup("Thông báo", f"Trang {page} đã được tải"))
+            ui_dispatcher.post(self.show_popup, "Thông báo", f"Trang {page} đã được tải")
 
-    def download_all_images(self, slug, folder_name, sub_name):
+    def download_all_images(self, slug, folder_name, sub_name, job=None):
         total_pages = self.total_pages_detected
         if total_pages < 1:
-            Clock.schedule_once(lambda dt: self.show_popup("Lỗi", "Chưa phát hiện trang nào!"))
+            ui_dispatcher.post(self.show_popup, "Lỗi", "Chưa phát hiện trang nào!")
             return
-        base_url = f"https://jjgirls.com/japanese/{slug}"
-        total_images = total_pages * 12
-        counter = 0
-        errors = []
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = []
-            for page in range(1, total_pages + 1):
-                for img_num in range(1, 13):
-                    if cancel_event.is_set():
-                        Clock.schedule_once(lambda dt: self.show_popup("Thông báo", "Download tất cả bị hủy!"))
-                        return
-                    while pause_event.is_set() and not cancel_event.is_set():
-                        time.sleep(0.1)
-                    img_url = f"{base_url}/{page}/{slug}-{img_num}.jpg"
-                    filename = f"{os.path.basename(folder_name)}-{page}-{img_num}.jpg"
-                    save_path = os.path.join(folder_name, filename)
-                    if os.path.exists(save_path):
-                        counter += 1
-                        continue
-                    futures.append(executor.submit(download_image, img_url, save_path))
-            for future in futures:
-                result = future.result()
-                if result:
-                    errors.append(result)
-                else:
-                    counter += 1
-                percent = (counter / total_images) * 100
-                Clock.schedule_once(lambda dt, p=percent: self.update_progress(p))
-        if errors:
-            Clock.schedule_once(lambda dt: self.show_popup("Cảnh báo", f"Lỗi: {', '.join(errors)}"))
+        errors = self.download_pages(range(1, total_pages + 1), slug, folder_name, sub_name, PRIORITY_BULK, job=job)
+        if errors is None:
+            ui_dispatcher.post(self.show_popup, "Thông báo", "Download tất cả bị hủy!")
+        elif errors:
+            ui_dispatcher.post(self.show_popup, "Cảnh báo", f"Lỗi: {', '.join(errors)}")
         else:
-            Clock.schedule_once(lambda dt: self.show_popup("Thông báo", "Download tất cả hoàn tất!"))
-
-    def download_range_images(self, start, end, slug, folder_name, sub_name):
-        base_url = f"https://jjgirls.com/japanese/{slug}"
-        total_images = (end - start + 1) * 12
-        counter = 0
-        errors = []
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = []
-            for page in range(start, end + 1):
-                for img_num in range(1, 13):
-                    if cancel_event.is_set():
-                        Clock.schedule_once(lambda dt: self.show_popup("Thông báo", "Download theo phạm vi bị hủy!"))
-                        return
-                    while pause_event.is_set() and not cancel_event.is_set():
-                        time.sleep(0.1)
-                    img_url = f"{base_url}/{page}/{slug}-{img_num}.jpg"
-                    filename = f"{os.path.basename(folder_name)}-{page}-{img_num}.jpg"
-                    save_path = os.path.join(folder_name, filename)
-                    if os.path.exists(save_path):
-                        counter += 1
-                        continue
-                    futures.append(executor.submit(download_image, img_url, save_path))
-            for future in futures:
-                result = future.result()
-                if result:
-                    errors.append(result)
-                else:
-                    counter += 1
-                percent = (counter / total_images) * 100
-                Clock.schedule_once(lambda dt, p=percent: self.update_progress(p))
-        if errors:
-            Clock.schedule_once(lambda dt: self.show_popup("Cảnh báo", f"Lỗi: {', '.join(errors)}"))
+            ui_dispatcher.post(self.show_popup, "Thông báo", "Download tất cả hoàn tất!")
+
+    def download_range_images(self, start, end, slug, folder_name, sub_name, job=None):
+        errors = self.download_pages(range(start, end + 1), slug, folder_name, sub_name, PRIORITY_BULK, job=job)
+        if errors is None:
+            ui_dispatcher.post(self.show_popup, "Thông báo", "Download theo phạm vi bị hủy!")
+        elif errors:
+            ui_dispatcher.post(self.show_popup, "Cảnh báo", f"Lỗi: {', '.join(errors)}")
         else:
-            Clock.schedule_once(lambda dt: self.show_popup("Thông báo", f"Download phạm vi {start}-{end} hoàn tất!"))
+            ui_dispatcher.post(self.show_popup, "Thông báo", f"Download phạm vi {start}-{end} hoàn tất!")
 
     def update_progress(self, percent):
         screen = self.manager.get_screen("download")
         screen.ids.progress_bar.value = percent
-        screen.ids.progress_label.text = f"{percent:.1f}%"
+        screen.ids.progress_label.text = f"{percent:.1f}% ({concurrency.decision().limit} luồng tải)"
+        if bandwidth.profile.defer_bulk:
+            screen.ids.progress_label.text += " - mạng tính phí, tải hàng loạt đang chờ Wi-Fi"
+
+    def on_bandwidth_profile(self, profile):
+        if not self.manager.has_screen("download"):  # Chưa mở lần nào: không dựng chỉ để ghi nhãn
+            return
+        screen = self.manager.get_screen("download")
+        if profile.defer_bulk:
+            screen.ids.progress_label.text = "Mạng tính phí: tải hàng loạt đang chờ Wi-Fi"
+        else:
+            self.update_progress(screen.ids.progress_bar.value)
 
     def open_history(self):
         hist_screen = self.manager.get_screen("history")
@@ -659,19 +973,86 @@ class MainScreen(Screen):
 
 # ===== MÀN HÌNH LỊCH SỬ =====
 class HistoryScreen(Screen):
-    def refresh_actor_history(self, filter_text=""):
-        layout = self.ids.actor_history
-        layout.clear_widgets()
-        actors = get_actor_history()
-        actors.sort(key=lambda x: x["name"].lower())
-        for act in actors:
-            if filter_text.lower() in act["name"].lower():
-                btn = Button(text=act["name"], size_hint_y=None, height=dp(40))
-                btn.bind(on_release=lambda b: self.select_actor(b.text))
-                layout.add_widget(btn)
+    # Ảnh bìa (thumbnail_path) được tạo từ ảnh -1-1.jpg đã có trên đĩa: không tải mạng, không giải mã ảnh gốc.
+    # Mỗi lần mở lịch sử có một lượt nền tạo lại các ảnh bìa thiếu/cũ; ô đang hiện chỉ đọc ảnh bìa nhỏ.
+    cover_requests = {}  # tên -> Future ảnh bìa đang tạo/đọc
+    cover_failed = set()  # Diễn viên có ảnh xem trước hỏng, không thử lại trong phiên
+    scanning_covers = False
+
+    def on_kv_post(self, base_widget):
+        self.filter_trigger = Clock.create_trigger(self.refresh_actor_history, HISTORY_SEARCH_DELAY)
+        self.cover_requests = {}
+        self.cover_failed = set()
+
+    def on_pre_enter(self):
+        if not self.scanning_covers:
+            self.scanning_covers = True
+            threading.Thread(target=self.find_stale_covers, daemon=True).start()
+
+    def refresh_actor_history(self, *args):
+        # RecycleView chỉ dựng lại các ô đang hiện, nên đổi data là đủ dù có hàng nghìn diễn viên
+        names = actor_index.search(self.ids.search_input.text)
+        self.ids.actor_history.data = [{"key": name, "text": name} for name in names]
 
     def filter_history(self, text):
-        self.refresh_actor_history(text)
+        self.filter_trigger()  # Gõ liên tục chỉ tìm một lần, sau khi ngừng gõ HISTORY_SEARCH_DELAY giây
+
+    def find_stale_covers(self):
+        # Chạy ở luồng nền: chỉ stat file, việc giải mã gửi theo lô cho decode_pool
+        stale = []
+        for name in actor_index.search(""):
+            cover = actor_index.cover(name)
+            if cover is not None and not cover_is_fresh(*cover):
+                stale.append((name, cover))
+        if stale:
+            logging.info(f"Building {len(stale)} actor covers")
+        ui_dispatcher.post(self.build_covers, stale)
+
+    def build_covers(self, stale):
+        self.scanning_covers = False
+        stale = [(name, cover) for name, cover in stale if name not in self.cover_requests]
+        for name, _ in stale:
+            image_cache.discard(self.cover_key(name))  # Texture cũ (nếu có) không còn đúng
+        futures = decode_pool.build_covers([cover for _, cover in stale], COVER_SIZE)
+        for (name, _), future in zip(stale, futures):
+            self.watch_cover(name, future)
+
+    def watch_cover(self, name, future):
+        self.cover_requests[name] = future
+        future.add_done_callback(lambda f: ui_dispatcher.post(self.on_cover, name, f))
+
+    @staticmethod
+    def cover_key(name):
+        return ("cover", name, COVER_SIZE)
+
+    def tile_texture(self, name):
+        texture = image_cache.get_texture(self.cover_key(name))
+        if texture is None and name not in self.cover_requests and name not in self.cover_failed:
+            cover = actor_index.cover(name)
+            if cover is not None:
+                self.watch_cover(name, decode_pool.build_covers([cover], COVER_SIZE)[0])
+        return texture
+
+    def on_cover(self, name, future):
+        if self.cover_requests.get(name) is future:
+            del self.cover_requests[name]
+        try:
+            buffer, data = future.result()
+        except Exception as e:
+            logging.error(f"Error building cover for {name}: {e}")
+            self.cover_failed.add(name)
+            return
+        for tile in visible_tiles(self.ids.actor_history):  # Ô không hiện thì chỉ cần file ảnh bìa trên đĩa
+            if tile.key == name:
+                texture = buffer_to_texture(buffer)
+                image_cache.put(self.cover_key(name), texture, data)
+                tile.show(texture)
+
+    def on_image_touch(self, instance, touch, name):
+        if instance.parent.collide_point(*touch.pos) and touch.button == 'left':  # Chạm cả ảnh bìa lẫn tên
+            self.select_actor(name)
+            return True
+        return False
 
     def select_actor(self, actor_name):
         main_scr = self.manager.get_screen("main")
@@ -685,29 +1066,103 @@ class FullImageScreen(Screen):
     slug = ""
     sub_name = ""
     auto_run = False
+    page_images = {}  # img_num -> (đường dẫn, texture) của trang đang hiển thị
+    page_ready = False  # Trang đang xem đã tải xong
+    _page_load = None
+
+    @property
+    def images_list(self):
+        return [self.page_images[img_num] for img_num in sorted(self.page_images)]
 
     def load_current_page(self):
+        # Không chặn luồng Kivy: dựng ô chờ ngay, ảnh nào xong thì điền vào ô đó
+        self.cancel_page_load()
+        actor, page = self.sub_name, self.current_page
+        load = PageLoad(actor, page, self.folder_name, self.slug)
+        self._page_load = load
+        prefetcher.hold(actor, page)
+        self.page_ready = False
+        self.page_images = {}
+        known = image_cache.get_page(actor, page)
+        slots = []
+        for img_num in range(1, IMAGES_PER_PAGE + 1):
+            img_path = image_path(self.folder_name, page, img_num)
+            if known is not None and img_path not in known:
+                continue
+            slots.append({"key": img_num})
+            if known is not None:
+                texture = image_cache.get_texture((actor, page, img_path))
+                if texture is not None:
+                    self.page_images[img_num] = (img_path, texture)
+        shown = set(self.page_images)
+        self.ids.page_images_view.data = slots
+        self.ids.page_images_view.scroll_y = 1
+        if known is not None and len(shown) == len(known):
+            self.ids.loading_label.text = ""
+            self.page_ready = True
+            self.prefetch_neighbours()
+            return
         self.ids.loading_label.text = "Đang tải..."
-        if self.current_page not in all_images:
-            self.load_page_images(self.current_page)
-        images_list = all_images.get(self.current_page, [])
-        self.ids.page_images_grid.clear_widgets()
-        if images_list:
-            for img_path, texture in images_list:
-                try:
-                    img_widget = KivyImage(texture=texture, size_hint_y=None, height=dp(400), fit_mode='contain')
-                    img_widget.bind(on_touch_down=lambda instance, touch, path=img_path, tex=texture: self.on_image_touch(instance, touch, path, tex))
-                    self.ids.page_images_grid.add_widget(img_widget)
-                except Exception as e:
-                    logging.error(f"Error displaying image {img_path}: {e}")
-                    self.show_popup("Lỗi", f"Không thể hiển thị ảnh: {str(e)}")
-        self.ids.loading_label.text = ""
+        threading.Thread(target=self.run_page_load, args=(load, shown), daemon=True).start()
 
-    def on_image_touch(self, instance, touch, img_path, texture):
-        if instance.collide_point(*touch.pos) and touch.button == 'left':
-            images_list = all_images.get(self.current_page, [])
-            current_index = next(i for i, (path, _) in enumerate(images_list) if path == img_path)
+    def run_page_load(self, load, shown):
+        if load.cancelled:
+            return
+        load.run(on_image=lambda n, path, buffer, data: ui_dispatcher.post(self.on_page_image, load, n, path, buffer, data),
+                 on_missing=lambda n: ui_dispatcher.post(self.remove_slot, load, n),
+                 skip=shown)
+        ui_dispatcher.post(self.on_page_loaded, load)
+
+    def on_page_image(self, load, img_num, img_path, buffer, data):
+        if self._page_load is not load:
+            return
+        texture = buffer_to_texture(buffer)
+        image_cache.put((load.actor, load.page, img_path), texture, data)
+        self.fill_slot(img_num, img_path, texture)
+
+    def fill_slot(self, img_num, img_path, texture):
+        self.page_images[img_num] = (img_path, texture)
+        for tile in visible_tiles(self.ids.page_images_view):
+            if tile.key == img_num:
+                tile.show(texture)
+
+    def tile_texture(self, img_num):
+        image = self.page_images.get(img_num)
+        return image[1] if image is not None else None
+
+    def remove_slot(self, load, img_num):
+        if self._page_load is load:
+            view = self.ids.page_images_view
+            view.data = [slot for slot in view.data if slot["key"] != img_num]
+
+    def on_page_loaded(self, load):
+        if self._page_load is load:
+            self.ids.loading_label.text = "" if self.ids.page_images_view.data else "Không có ảnh nào để hiển thị"
+            self.page_ready = True
+            self.prefetch_neighbours()
+
+    def prefetch_neighbours(self):
+        # Chỉ làm ấm khi trang đang xem đã xong, để không tranh mạng/CPU với nó
+        total_pages = self.manager.get_screen("main").total_pages_detected
+        prefetcher.schedule(self.sub_name, self.folder_name, self.slug, self.current_page, total_pages,
+                            slideshow=self.auto_run)
+
+    def cancel_page_load(self):
+        if self._page_load is not None:
+            self._page_load.cancel()
+            self._page_load = None
+
+    def on_leave(self):
+        self.cancel_page_load()
+        prefetcher.cancel_all()
+
+    def on_image_touch(self, instance, touch, img_num):
+        if instance.collide_point(*touch.pos) and touch.button == 'left' and img_num in self.page_images:
+            images_list = self.images_list
+            current_index = sorted(self.page_images).index(img_num)
             self.show_enlarged_image(images_list, current_index)
+            return True
+        return False
 
     def show_enlarged_image(self, images_list, current_index):
         popup = Popup(title="", size_hint=(1, 1), auto_dismiss=False)
@@ -734,8 +1189,49 @@ class FullImageScreen(Screen):
         slideshow_event = [None]
         last_swipe_time = [0]  # Thời gian lần trượt cuối cùng để chống lặp
 
+        # Ảnh gốc chỉ giải mã cho ảnh đang xem và ảnh kề bên; ra khỏi vùng đó là bỏ texture
+        full_textures = {}  # index -> texture độ phân giải đầy đủ
+        full_loads = {}  # index -> Future đang giải mã
+        full_size = int(max(Window.width, Window.height))
+
+        def load_full_images(index):
+            wanted = range(max(0, index - ENLARGED_NEIGHBOURS), min(len(images_list), index + ENLARGED_NEIGHBOURS + 1))
+            for i in list(full_textures):
+                if i not in wanted:
+                    del full_textures[i]
+            for i in list(full_loads):
+                if i not in wanted:
+                    full_loads.pop(i).cancel()
+            for i in wanted:
+                if i not in full_textures and i not in full_loads:
+                    future = decode_pool.decode_full(images_list[i][0], full_size)
+                    full_loads[i] = future
+                    future.add_done_callback(lambda f, i=i: ui_dispatcher.post(on_full_image, i, f))
+
+        def on_full_image(index, future):
+            if full_loads.get(index) is not future:
+                return
+            del full_loads[index]
+            try:
+                buffer, _ = future.result()
+            except Exception as e:
+                logging.error(f"Error decoding full image {images_list[index][0]}: {e}")
+                return
+            full_textures[index] = buffer_to_texture(buffer)
+            if index == current_index:
+                img_widget.texture = full_textures[index]
+
+        def release_full_images(*args):
+            if slideshow_event[0]:
+                Clock.unschedule(slideshow_event[0])
+            for future in full_loads.values():
+                future.cancel()
+            full_loads.clear()
+            full_textures.clear()
+
         def update_image(index):
             img_path, texture = images_list[index]
+            texture = full_textures.get(index, texture)
             # Tính toán kích thước để hiển thị đầy màn hình
             texture_width, texture_height = texture.size
             aspect_ratio = texture_width / texture_height
@@ -753,6 +1249,7 @@ class FullImageScreen(Screen):
             img_widget.size_hint = (None, None)
             img_widget.pos_hint = {'center_x': 0.5, 'center_y': 0.5}
             nav_label.text = f"Ảnh {index + 1}/{len(images_list)}"
+            load_full_images(index)
 
         touch_start_x = [None]  # Vị trí bắt đầu chạm
 
@@ -807,6 +1304,7 @@ class FullImageScreen(Screen):
         img_widget.bind(on_touch_down=on_touch_down)
         img_widget.bind(on_touch_up=on_touch_up)
         close_btn.bind(on_release=popup.dismiss)
+        popup.bind(on_dismiss=release_full_images)
         play_btn.bind(on_release=start_slideshow)
 
         update_image(current_index)
@@ -815,49 +1313,17 @@ class FullImageScreen(Screen):
     def prev_image(self):
         if self.current_page > 1:
             self.current_page -= 1
-            if self.current_page not in all_images:
-                self.load_page_images(self.current_page)
             self.load_current_page()
 
     def next_image(self):
         main_screen = self.manager.get_screen("main")
         if self.current_page < main_screen.total_pages_detected:
             self.current_page += 1
-            if self.current_page not in all_images:
-                self.load_page_images(self.current_page)
             self.load_current_page()
         elif self.auto_run:
             self.toggle_slideshow()
             self.show_popup("Thông báo", "Đã đến trang cuối cùng!")
 
-    def load_page_images(self, page):
-        if page in all_images:
-            return
-        base_url = f"https://jjgirls.com/japanese/{self.slug}"
-        all_images[page] = []
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = []
-            for img_num in range(1, 13):
-                local_img_path = os.path.join(self.folder_name, f"{os.path.basename(self.folder_name)}-{page}-{img_num}.jpg")
-                if os.path.exists(local_img_path):
-                    pil_img = PILImage.open(local_img_path)
-                    pil_img = correct_image_orientation(pil_img)
-                    pil_img.thumbnail((400, 400), PILImage.Resampling.LANCZOS)
-                    texture = pil_to_texture(pil_img)
-                    all_images[page].append((local_img_path, texture))
-                else:
-                    img_url = f"{base_url}/{page}/{self.slug}-{img_num}.jpg"
-                    futures.append(executor.submit(download_image, img_url, local_img_path))
-            for future in futures:
-                result = future.result()
-                if not result:  # No error
-                    local_img_path = os.path.join(self.folder_name, f"{os.path.basename(self.folder_name)}-{page}-{len(all_images[page]) + 1}.jpg")
-                    pil_img = PILImage.open(local_img_path)
-                    pil_img = correct_image_orientation(pil_img)
-                    pil_img.thumbnail((400, 400), PILImage.Resampling.LANCZOS)
-                    texture = pil_to_texture(pil_img)
-                    all_images[page].append((local_img_path, texture))
-
     def toggle_fullscreen(self):
         app = App.get_running_app()
         app.root_window.fullscreen = not app.root_window.fullscreen
@@ -866,6 +1332,8 @@ class FullImageScreen(Screen):
         self.auto_run = not self.auto_run
         if self.auto_run:
             self.start_slideshow()
+            if self.page_ready:
+                self.prefetch_neighbours()
         else:
             if hasattr(self, "slideshow_event") and self.slideshow_event:
                 Clock.unschedule(self.slideshow_event)
@@ -875,7 +1343,8 @@ class FullImageScreen(Screen):
 
     def download_current_page(self):
         main_screen = self.manager.get_screen("main")
-        threading.Thread(target=main_screen.download_page_images, args=(self.current_page, self.slug, self.folder_name, self.sub_name), daemon=True).start()
+        JobControl(f"{self.sub_name} trang {self.current_page}", main_screen.download_page_images,
+                   (self.current_page, self.slug, self.folder_name, self.sub_name)).start()
 
     def show_popup(self, title, message):
         popup = Popup(title=title, content=Label(text=message), size_hint=(None, None), size=(300, 200))
@@ -883,24 +1352,74 @@ class FullImageScreen(Screen):
 
 # ===== MÀN HÌNH ĐIỀU KHIỂN DOWNLOAD =====
 class DownloadScreen(Screen):
+    # Tác động lên từng lượt tải đang có; ảnh đang xem/xem trước không thuộc lượt nào nên không bị dừng
     def pause_download(self):
-        pause_event.set()
+        for job in download_jobs.snapshot():
+            job.pause()
         self.ids.progress_label.text = "Paused"
 
     def resume_download(self):
-        pause_event.clear()
+        for job in download_jobs.snapshot():
+            if job.cancelled and not job.running:
+                job.start()  # Lượt đã huỷ: chạy lại, manifest và file .part giúp bỏ qua phần đã tải
+            else:
+                job.resume()
         self.ids.progress_label.text = "Resumed"
 
     def cancel_download(self):
-        cancel_event.set()
+        for job in download_jobs.snapshot():
+            job.cancel()
         self.ids.progress_label.text = "Cancelled"
 
+# ===== SCREEN MANAGER =====
+# Lúc khởi động chỉ dựng MainScreen; màn hình khác được dựng (áp luật KV, tạo widget) ở lần đầu được hỏi tới.
+# ScreenManager đổi màn hình qua get_screen, nên "app.root.current = ..." và manager.get_screen(...) đều dùng được.
+class LazyScreenManager(ScreenManager):
+    def get_screen(self, name):
+        if not self.has_screen(name) and name in LAZY_SCREENS:
+            started = time.perf_counter()
+            self.add_widget(LAZY_SCREENS[name]())
+            logging.debug(f"Built screen {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return super().get_screen(name)
+
+LAZY_SCREENS = {
+    "history": HistoryScreen,
+    "full_image": FullImageScreen,
+    "download": DownloadScreen,
+}
+
 # ===== MAIN APP =====
+def warm_up():
+    # Luồng nền: mở DB (WAL, tạo bảng) và nạp chỉ mục diễn viên một lần; truy vấn đến sớm chỉ chờ khoá của db
+    started = time.perf_counter()
+    init_db()
+    actor_index.search("")
+    logging.info(f"Database ready in {(time.perf_counter() - started) * 1000:.0f}ms")
+
 class AVDownloaderApp(App):
     def build(self):
+        startup_timer.mark("imports")
         Window.size = (800, 600)  # Đặt kích thước cửa sổ mặc định
         self.title = "Trình Tải Hình Ảnh AV (Kivy)"
-        return Builder.load_string(KV)
+        decode_pool.start()  # Fork tiến trình giải mã trước khi các luồng nền chạy
+        bandwidth.refresh()
+        Clock.schedule_interval(lambda dt: bandwidth.refresh(), METERED_CHECK_INTERVAL)
+        root = Builder.load_string(KV)
+        startup_timer.mark("build")
+        return root
+
+    def on_start(self):
+        threading.Thread(target=warm_up, daemon=True).start()
+        Window.bind(on_flip=self.on_first_frame)
+
+    def on_first_frame(self, window):
+        window.unbind(on_flip=self.on_first_frame)
+        startup_timer.mark("first frame")
+        startup_timer.log()
+
+    def on_stop(self):
+        decode_pool.shutdown()
+        db.close()  # Ghi nốt hàng chờ manifest
 
 if __name__ == "__main__":
     AVDownloaderApp().run()
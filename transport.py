@@ -0,0 +1,82 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+
+from httpbase import HTTP_HEADERS, MAX_CONNECTIONS_PER_HOST, POOL_HOSTS, parse_retry_after, transport_stats
+
+# requests/urllib3 nạp mất ~100ms: downloader chỉ import module này ở request đầu tiên,
+# nên app và CLI khởi động không phải chờ.
+
+# ===== HTTP TRANSPORT =====
+# Mọi đường tải dùng chung một adapter (pool keep-alive), mỗi luồng một Session riêng.
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        transport_stats.record(self.host, conn)
+        return conn
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        transport_stats.record(self.host, conn)
+        return conn
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+_http_adapter = None
+_http_lock = threading.Lock()
+_http_local = threading.local()
+
+def get_http_adapter():
+    global _http_adapter
+    with _http_lock:
+        if _http_adapter is None:
+            # Giới hạn số lượt tải mỗi host do download_engine giữ; pool không chặn để file tải dở
+            # của job tạm dừng (vẫn giữ kết nối) không làm kẹt ảnh đang xem
+            _http_adapter = PooledAdapter(pool_connections=POOL_HOSTS, pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                                          pool_block=False, max_retries=0)
+        return _http_adapter
+
+def get_session():
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(HTTP_HEADERS)
+        adapter = get_http_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_local.session = session
+    return session
+
+# ===== ERRORS =====
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+class TransientHTTPError(requests.HTTPError):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} for {response.url}", response=response)
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+class IncompleteDownload(requests.ConnectionError):
+    # Kết nối đóng trước khi nhận đủ thân: file .part được giữ, lần thử sau tải tiếp bằng Range
+    def __init__(self, outcome):
+        super().__init__(outcome.error)
+        self.outcome = outcome
+
+def is_transient(error):
+    return (isinstance(error, TRANSIENT_ERRORS + (TransientHTTPError,))
+            and not isinstance(error, requests.exceptions.SSLError))
+
+def is_timeout(error):
+    # Hết thời gian chờ khi đang đọc thân (iter_content), requests bọc ReadTimeoutError trong ConnectionError
+    if isinstance(error, (requests.Timeout, ReadTimeoutError)):
+        return True
+    return (isinstance(error, requests.ConnectionError) and bool(error.args)
+            and isinstance(error.args[0], ReadTimeoutError))